@@ -3,56 +3,116 @@
 使用大模型进行智能意图识别和交互
 """
 import re
-import json
-from typing import Dict, Optional, Tuple
+import orjson
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, List, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from config import Config
 
-class NLPProcessor:
-    """自然语言处理器，使用大模型进行智能意图识别"""
-    
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model=Config.DEFAULT_MODEL,
-            temperature=0.1,
-            api_key=Config.OPENAI_API_KEY,
-            base_url=Config.OPENAI_BASE_URL,
-            timeout=120,
-            extra_body=dict(chat_template_kwargs=dict(enable_thinking=False))
-        )
-        
-        # 支持的语言列表
-        self.supported_languages = [
-            'English', '中文', '日文', '韩文', '法文', '德文', 
-            '西班牙文', '俄文', '意大利文', '葡萄牙文', 
-            '阿拉伯文', '泰文', '越南文'
-        ]
-    
-    def analyze_user_intent(self, user_input: str, has_document: bool = False) -> Dict[str, any]:
-        """
-        使用大模型分析用户意图
-        返回格式：
-        {
-            'request_type': 'translation'|'other',
-            'has_document': bool,
-            'target_language': str|None,
-            'content': str,
-            'needs_clarification': bool,
-            'question': str|None
-        }
-        """
-        prompt_template = """# 文档翻译Agent Prompt 
+@dataclass(slots=True, frozen=True)
+class IntentResult:
+    """意图识别结果"""
+    request_type: str  # 'translation' | 'other'
+    has_document: bool
+    target_language: Optional[str] = None
+    content: str = ''
+    needs_clarification: bool = False
+    question: Optional[str] = None
 
-你是一个文档翻译助手。分析用户输入和上传的文档，判断是否为翻译任务。
+    def to_dict(self) -> Dict[str, any]:
+        """转换为字典，兼容原有的字典格式调用方"""
+        return asdict(self)
 
-## 用户输入
-<user_input>
-{user_input}
-</user_input>
+# 大模型调用失败时返回的默认结果，预先创建以避免重复分配
+_FALLBACK_OTHER = IntentResult(
+    request_type='other',
+    has_document=False,
+    content='抱歉，我暂时无法理解您的需求，请重新描述。'
+)
 
-## 文档状态
-has_document: {has_document}
+def _as_bool(value) -> bool:
+    """规范化模型输出的布尔字段：字符串按内容判断，避免"false"被当作True"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes', '1', '是')
+    return value is True
+
+# 从LLM回复中提取```json```代码块
+_JSON_BLOCK_RE = re.compile(r'```json\s*(\{.*?\})\s*```', re.DOTALL)
+
+# 目标语言关键词，按识别优先级排列
+_LANGUAGE_KEYWORDS = [
+    (['英语', '英文', 'English'], 'English'),
+    (['中文', '中国话', 'Chinese', '汉语', '简体中文', '繁体中文'], '中文'),
+    (['日语', '日文', 'Japanese', '日本语'], '日文'),
+    (['韩语', '韩文', 'Korean', '朝鲜语'], '韩文'),
+    (['法语', '法文', 'French'], '法文'),
+    (['德语', '德文', 'German'], '德文'),
+    (['西班牙语', '西班牙文', 'Spanish'], '西班牙文'),
+    (['俄语', '俄文', 'Russian'], '俄文'),
+    (['意大利语', '意大利文', 'Italian'], '意大利文'),
+    (['葡萄牙语', '葡萄牙文', 'Portuguese'], '葡萄牙文'),
+    (['阿拉伯语', '阿拉伯文', 'Arabic'], '阿拉伯文'),
+    (['泰语', '泰文', 'Thai'], '泰文'),
+    (['越南语', '越南文', 'Vietnamese'], '越南文')
+]
+
+# 表示翻译意图的关键词
+_TRANSLATION_KEYWORDS = ['翻译', 'translate', '译成', '转换', '变成', '改成']
+
+# 关键词（小写） -> 语言优先级；翻译意图关键词对应None
+_KEYWORD_TABLE = {keyword.lower(): None for keyword in _TRANSLATION_KEYWORDS}
+for _priority, (_keywords, _language) in enumerate(_LANGUAGE_KEYWORDS):
+    for _keyword in _keywords:
+        _KEYWORD_TABLE[_keyword.lower()] = _priority
+
+def _keyword_pattern(keyword: str) -> str:
+    """关键词的正则片段；英文语言名要求前后不是字母，避免匹配到单词内部（如Thailand中的Thai）"""
+    pattern = re.escape(keyword)
+    if keyword.isascii() and _KEYWORD_TABLE[keyword.lower()] is not None:
+        pattern = f"(?<![A-Za-z]){pattern}(?![A-Za-z])"
+    return pattern
+
+# 所有关键词合并为一个正则，长关键词优先，一次扫描即可同时得到翻译意图和目标语言
+_KEYWORD_RE = re.compile(
+    "|".join(_keyword_pattern(keyword) for keyword in sorted(_KEYWORD_TABLE, key=len, reverse=True)),
+    re.IGNORECASE
+)
+
+# 紧跟在方向词（译成/转为/翻译到/into/to等）之后的语言名才视为目标语言，其余语言名可能是源语言
+_LANGUAGE_KEYWORD_PATTERN = "|".join(
+    _keyword_pattern(keyword)
+    for keyword in sorted((k for k, v in _KEYWORD_TABLE.items() if v is not None), key=len, reverse=True)
+)
+# 方向词后可能并列多种语言（如“英文和法文”“English and French”），整段捕获后逐个识别
+_LANGUAGE_SEPARATOR_PATTERN = r"\s*(?:和|与|以及|及|或者|或|、|,|，|/|&|(?<![A-Za-z])(?:and|or)(?![A-Za-z]))\s*"
+_TARGET_LANGUAGE_RE = re.compile(
+    rf"(?:(?:译|转换|转|变|改|换)(?:成|为|到)|(?<![A-Za-z])(?:into|to)\s+)\s*"
+    rf"((?:{_LANGUAGE_KEYWORD_PATTERN})(?:{_LANGUAGE_SEPARATOR_PATTERN}(?:{_LANGUAGE_KEYWORD_PATTERN}))*)",
+    re.IGNORECASE
+)
+
+# 语言名称到支持语言的映射，键均为小写
+_LANGUAGE_MAPPING = {
+    '英语': 'English', '英文': 'English', 'english': 'English',
+    '中国话': '中文', '汉语': '中文', 'chinese': '中文',
+    '日语': '日文', 'japanese': '日文',
+    '韩语': '韩文', 'korean': '韩文',
+    '法语': '法文', 'french': '法文',
+    '德语': '德文', 'german': '德文',
+    '西班牙语': '西班牙文', 'spanish': '西班牙文',
+    '俄语': '俄文', 'russian': '俄文',
+    '意大利语': '意大利文', 'italian': '意大利文',
+    '葡萄牙语': '葡萄牙文', 'portuguese': '葡萄牙文',
+    '阿拉伯文': '阿拉伯文', 'arabic': '阿拉伯文',
+    '泰文': '泰文', 'thai': '泰文',
+    '越南文': '越南文', 'vietnamese': '越南文'
+}
+
+# 意图识别的静态系统提示，与用户输入分离，便于服务端命中前缀缓存
+INTENT_SYSTEM_PROMPT = """# 文档翻译Agent Prompt 
+
+你是一个文档翻译助手。分析用户输入和上传的文档，判断是否为翻译任务。
 
 ## 判断逻辑
 1. **有文档上传且文本包含翻译指令** → 翻译任务
@@ -67,6 +127,7 @@ has_document: {has_document}
 - 其他语言按标准名称识别
 
 ## 输出格式
+直接输出一个JSON对象，不要附加任何解释：
 ```json
 {{
   "request_type": "translation" | "other",
@@ -87,13 +148,66 @@ has_document: {has_document}
 ## 重要提醒
 - 必须准确识别目标语言，如"帮我把这篇文章翻译成中文"中的"中文"
 - 如果用户明确说了目标语言，不要再追问
-- 支持的目标语言：English、中文、日文、韩文、法文、德文、西班牙文、俄文、意大利文、葡萄牙文、阿拉伯文、泰文、越南文
+- 支持的目标语言：English、中文、日文、韩文、法文、德文、西班牙文、俄文、意大利文、葡萄牙文、阿拉伯文、泰文、越南文"""
+
+# 意图识别的用户消息模板，只包含每次请求变化的部分
+INTENT_USER_PROMPT = """## 用户输入
+<user_input>
+{user_input}
+</user_input>
+
+## 文档状态
+has_document: {has_document}
 
 现在分析用户输入并输出JSON格式结果。"""
 
+class NLPProcessor:
+    """自然语言处理器，使用大模型进行智能意图识别"""
+    
+    def __init__(self):
+        self.llm = ChatOpenAI(
+            model=Config.INTENT_MODEL,
+            temperature=0.1,
+            api_key=Config.OPENAI_API_KEY,
+            base_url=Config.INTENT_BASE_URL,
+            timeout=120,
+            max_tokens=Config.INTENT_MAX_TOKENS,  # 只需输出一个小JSON，限制生成长度
+            model_kwargs=dict(response_format={"type": "json_object"}),  # JSON模式，约束输出为合法JSON
+            extra_body=dict(chat_template_kwargs=dict(enable_thinking=False))
+        )
+        
+        # 静态系统提示在前、用户输入在后，所有请求共享同一前缀
+        self.intent_prompt = ChatPromptTemplate.from_messages([
+            ("system", INTENT_SYSTEM_PROMPT),
+            ("human", INTENT_USER_PROMPT)
+        ])
+        
+        # 支持的语言列表
+        self.supported_languages = [
+            'English', '中文', '日文', '韩文', '法文', '德文', 
+            '西班牙文', '俄文', '意大利文', '葡萄牙文', 
+            '阿拉伯文', '泰文', '越南文'
+        ]
+    
+    def analyze_user_intent(self, user_input: str, has_document: bool = False) -> IntentResult:
+        """
+        使用大模型分析用户意图
+        返回 IntentResult，字段：
+            request_type: 'translation'|'other'
+            has_document: bool
+            target_language: str|None
+            content: str
+            needs_clarification: bool
+            question: str|None
+        """
+        # 意图明确的输入直接由规则识别，无需调用大模型
+        if Config.INTENT_RULES_ENABLED:
+            rule_result = self._rule_based_intent(user_input, has_document)
+            if rule_result is not None:
+                return rule_result
+        
         try:
-            prompt = ChatPromptTemplate.from_template(prompt_template)
-            response = self.llm.invoke(prompt.format_messages(
+            response = self.llm.invoke(self.intent_prompt.format_messages(
                 user_input=user_input,
                 has_document=has_document
             ))
@@ -104,20 +218,15 @@ has_document: {has_document}
             
         except Exception as e:
             print(f"LLM意图识别失败: {e}")
-            return {
-                'request_type': 'other',
-                'has_document': has_document,
-                'target_language': None,
-                'content': '抱歉，我暂时无法理解您的需求，请重新描述。',
-                'needs_clarification': False,
-                'question': None
-            }
+            if has_document == _FALLBACK_OTHER.has_document:
+                return _FALLBACK_OTHER
+            return replace(_FALLBACK_OTHER, has_document=has_document)
     
-    def _parse_llm_json_response(self, llm_content: str, user_input: str, has_document: bool) -> Dict[str, any]:
+    def _parse_llm_json_response(self, llm_content: str, user_input: str, has_document: bool) -> IntentResult:
         """解析LLM的JSON回复内容"""
         try:
-            # 尝试从回复中提取JSON
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', llm_content, re.DOTALL)
+            # JSON模式下回复即为JSON；兼容不支持JSON模式的服务，仍尝试提取```json```代码块
+            json_match = _JSON_BLOCK_RE.search(llm_content)
             if json_match:
                 json_str = json_match.group(1)
             else:
@@ -125,109 +234,120 @@ has_document: {has_document}
                 json_str = llm_content
             
             # 解析JSON
-            result = json.loads(json_str)
+            result = orjson.loads(json_str)
+            if not isinstance(result, dict):
+                raise orjson.JSONDecodeError("LLM回复不是JSON对象", json_str, 0)
             
-            # 验证和补充字段
-            result['has_document'] = has_document
+            target_language = result.get('target_language')
+            needs_clarification = _as_bool(result.get('needs_clarification', False))
+            question = result.get('question')
             
             # 验证target_language是否在支持列表中
-            if result.get('target_language') and result['target_language'] not in ['需要确认'] + self.supported_languages:
+            if target_language and target_language not in ['需要确认'] + self.supported_languages:
                 # 尝试映射到支持的语言
-                mapped_lang = self._map_to_supported_language(result['target_language'])
+                mapped_lang = self._map_to_supported_language(target_language)
                 if mapped_lang:
-                    result['target_language'] = mapped_lang
+                    target_language = mapped_lang
                 else:
-                    result['target_language'] = '需要确认'
-                    result['needs_clarification'] = True
-                    result['question'] = f"请明确指定目标语言，支持的语言有：{', '.join(self.supported_languages)}"
+                    target_language = '需要确认'
+                    needs_clarification = True
+                    question = f"请明确指定目标语言，支持的语言有：{', '.join(self.supported_languages)}"
             
-            return result
+            return IntentResult(
+                request_type=result.get('request_type', 'other'),
+                has_document=has_document,
+                target_language=target_language,
+                content=result.get('content') or '',
+                needs_clarification=needs_clarification,
+                question=question
+            )
             
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             # JSON解析失败，使用备用逻辑
             return self._fallback_analysis(user_input, has_document, llm_content)
     
     def _map_to_supported_language(self, language: str) -> Optional[str]:
         """映射到支持的语言"""
-        language_mapping = {
-            '英语': 'English', '英文': 'English', 'english': 'English',
-            '中国话': '中文', '汉语': '中文', 'chinese': '中文',
-            '日语': '日文', 'japanese': '日文',
-            '韩语': '韩文', 'korean': '韩文',
-            '法语': '法文', 'french': '法文',
-            '德语': '德文', 'german': '德文',
-            '西班牙语': '西班牙文', 'spanish': '西班牙文',
-            '俄语': '俄文', 'russian': '俄文',
-            '意大利语': '意大利文', 'italian': '意大利文',
-            '葡萄牙语': '葡萄牙文', 'portuguese': '葡萄牙文',
-            '阿拉伯文': '阿拉伯文', 'arabic': '阿拉伯文',
-            '泰文': '泰文', 'thai': '泰文',
-            '越南文': '越南文', 'vietnamese': '越南文'
-        }
-        
-        return language_mapping.get(language.lower())
+        return _LANGUAGE_MAPPING.get(language.lower())
     
-    def _fallback_analysis(self, user_input: str, has_document: bool, llm_content: str) -> Dict[str, any]:
+    def _fallback_analysis(self, user_input: str, has_document: bool, llm_content: str) -> IntentResult:
         """备用分析逻辑"""
-        # 简单的关键词匹配
-        translation_keywords = ['翻译', 'translate', '译成', '转换', '变成', '改成']
-        is_translation = has_document or any(keyword in user_input.lower() for keyword in translation_keywords)
+        # 简单的关键词匹配，一次扫描同时得到翻译意图和目标语言
+        has_translation_keyword, languages = self._scan_keywords(user_input)
+        is_translation = has_document or has_translation_keyword
         
         if is_translation:
-            # 尝试提取目标语言
-            target_language = self._extract_language_from_input(user_input)
-            
+            target_language = languages[0] if languages else None
             if target_language:
-                return {
-                    'request_type': 'translation',
-                    'has_document': has_document,
-                    'target_language': target_language,
-                    'content': f'已识别目标语言为【{target_language}】，准备开始翻译。',
-                    'needs_clarification': False,
-                    'question': None
-                }
+                return IntentResult(
+                    request_type='translation',
+                    has_document=has_document,
+                    target_language=target_language,
+                    content=f'已识别目标语言为【{target_language}】，准备开始翻译。'
+                )
             else:
-                return {
-                    'request_type': 'translation',
-                    'has_document': has_document,
-                    'target_language': '需要确认',
-                    'content': '我理解您需要翻译，请告诉我您想翻译成什么语言？',
-                    'needs_clarification': True,
-                    'question': f'请选择目标语言：{", ".join(self.supported_languages)}'
-                }
+                return IntentResult(
+                    request_type='translation',
+                    has_document=has_document,
+                    target_language='需要确认',
+                    content='我理解您需要翻译，请告诉我您想翻译成什么语言？',
+                    needs_clarification=True,
+                    question=f'请选择目标语言：{", ".join(self.supported_languages)}'
+                )
         else:
-            return {
-                'request_type': 'other',
-                'has_document': has_document,
-                'target_language': None,
-                'content': llm_content or '您好！我是智能翻译助手，可以帮您翻译文档。请告诉我您的需求。',
-                'needs_clarification': False,
-                'question': None
-            }
+            return IntentResult(
+                request_type='other',
+                has_document=has_document,
+                content=llm_content or '您好！我是智能翻译助手，可以帮您翻译文档。请告诉我您的需求。'
+            )
     
     def _extract_language_from_input(self, user_input: str) -> Optional[str]:
         """从用户输入中提取目标语言"""
-        language_patterns = {
-            r'(?:英语|英文|English|english)': 'English',
-            r'(?:中文|中国话|Chinese|chinese|汉语|简体中文|繁体中文)': '中文',
-            r'(?:日语|日文|Japanese|japanese|日本语)': '日文',
-            r'(?:韩语|韩文|Korean|korean|朝鲜语)': '韩文',
-            r'(?:法语|法文|French|french)': '法文',
-            r'(?:德语|德文|German|german)': '德文',
-            r'(?:西班牙语|西班牙文|Spanish|spanish)': '西班牙文',
-            r'(?:俄语|俄文|Russian|russian)': '俄文',
-            r'(?:意大利语|意大利文|Italian|italian)': '意大利文',
-            r'(?:葡萄牙语|葡萄牙文|Portuguese|portuguese)': '葡萄牙文',
-            r'(?:阿拉伯语|阿拉伯文|Arabic|arabic)': '阿拉伯文',
-            r'(?:泰语|泰文|Thai|thai)': '泰文',
-            r'(?:越南语|越南文|Vietnamese|vietnamese)': '越南文'
-        }
+        languages = self._scan_keywords(user_input)[1]
+        return languages[0] if languages else None
+    
+    def _scan_keywords(self, user_input: str) -> Tuple[bool, List[str]]:
+        """
+        单次扫描用户输入中的关键词
+        返回 (是否包含翻译意图关键词, 按优先级排序的去重语言列表)
+        """
+        has_translation_keyword = False
+        priorities = set()
+        for match in _KEYWORD_RE.finditer(user_input):
+            priority = _KEYWORD_TABLE[match.group().lower()]
+            if priority is None:
+                has_translation_keyword = True
+            else:
+                priorities.add(priority)
+        
+        return has_translation_keyword, [_LANGUAGE_KEYWORDS[priority][1] for priority in sorted(priorities)]
+    
+    def _rule_based_intent(self, user_input: str, has_document: bool) -> Optional[IntentResult]:
+        """
+        基于关键词的快速意图识别
+        仅当已上传文档、输入包含翻译意图关键词，且方向词后只指明一种目标语言时直接返回结果，
+        其余情况（包括列出多种目标语言）返回None交由大模型判断
+        """
+        if not has_document:
+            return None
         
-        for pattern, language in language_patterns.items():
-            if re.search(pattern, user_input, re.IGNORECASE):
-                return language
+        has_translation_keyword = self._scan_keywords(user_input)[0]
+        if not has_translation_keyword:
+            return None
         
-        return None
+        targets = set()
+        for match in _TARGET_LANGUAGE_RE.finditer(user_input):
+            targets.update(self._scan_keywords(match.group(1))[1])
+        if len(targets) != 1:
+            return None
+        
+        target_language = targets.pop()
+        return IntentResult(
+            request_type='translation',
+            has_document=has_document,
+            target_language=target_language,
+            content=f'已识别目标语言为【{target_language}】，准备开始翻译。'
+        )
     
     # def extract_translation_intent(self, user_input: str, has_document: bool = False) -> Dict[str, str]:
     #     """
@@ -2,9 +2,281 @@
 翻译服务模块
 封装了翻译的核心业务逻辑，取代了旧的工作流。
 """
-from core.document_chunker import DocumentChunker
+import asyncio
+import hashlib
+import io
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Optional, AsyncIterator
+from config import config
+from core.document_chunker import DocumentChunker, chunk_document_in_process
 from core.translation_engine import TranslationEngine
-from utils.logger import get_logger
+from core.models import Chunk, TranslationResult
+from utils.logger import get_logger, process_pool_options
+
+class PersistentTranslationCache:
+    """
+    基于SQLite文件的译文缓存。
+    多个worker进程共享同一个缓存文件，服务重启后缓存依然有效。
+    """
+    def __init__(self, db_path: str, ttl: int):
+        """
+        Args:
+            db_path (str): 缓存数据库文件路径。
+            ttl (int): 缓存有效期（秒）。
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        # sqlite连接不能跨线程使用，每个线程持有自己的连接
+        self._local = threading.local()
+        conn = self._get_connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS translation_cache (
+                key TEXT PRIMARY KEY,
+                translated_content TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        # 启动时清理过期条目
+        conn.execute("DELETE FROM translation_cache WHERE expires_at < ?", (time.time(),))
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """读取未过期的译文"""
+        row = self._get_connection().execute(
+            "SELECT translated_content FROM translation_cache WHERE key = ? AND expires_at >= ?",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_many(self, items: Dict[str, str]):
+        """在一个事务中批量写入译文"""
+        expires_at = time.time() + self.ttl
+        conn = self._get_connection()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO translation_cache (key, translated_content, expires_at) VALUES (?, ?, ?)",
+                [(key, translated_content, expires_at) for key, translated_content in items.items()]
+            )
+
+class CachedTranslator:
+    """
+    带缓存的翻译器，包装 TranslationEngine。
+    以 (模型, 目标语言, 术语, 原文) 的SHA-256作为键缓存单块译文，
+    命中缓存的块直接复用译文，只有未命中的块才会发送给LLM。
+    缓存分两级：进程内LRU，以及可选的SQLite持久化缓存（跨进程、跨重启共享）。
+    """
+    def __init__(self, translation_engine: TranslationEngine, ttl: int = None, max_entries: int = None,
+                 persistent_cache: PersistentTranslationCache = None):
+        """
+        Args:
+            translation_engine (TranslationEngine): 实际执行翻译的引擎。
+            ttl (int, optional): 缓存有效期（秒），默认取配置。
+            max_entries (int, optional): 内存缓存最大条目数，超出后按LRU淘汰。
+            persistent_cache (PersistentTranslationCache, optional): 持久化缓存，内存未命中时查询。
+        """
+        self.translation_engine = translation_engine
+        self.ttl = ttl if ttl is not None else config.TRANSLATION_CACHE_TTL
+        self.max_entries = max_entries if max_entries is not None else config.TRANSLATION_CACHE_MAX_ENTRIES
+        self.logger = get_logger()
+        # key -> (过期时间戳, 译文)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.persistent_cache = persistent_cache
+
+    @staticmethod
+    def make_key_prefix(target_language: str, terminology: Dict[str, str] = None):
+        """
+        对模型、目标语言和术语部分预先计算哈希状态。
+        同一请求内所有块共享这一前缀，术语词典只序列化一次。
+        """
+        raw = f"{config.DEFAULT_MODEL}:{target_language}:{json.dumps(terminology or {}, sort_keys=True, ensure_ascii=False)}:"
+        return hashlib.sha256(raw.encode("utf-8"))
+
+    @staticmethod
+    def make_key_from_prefix(prefix, content: str) -> str:
+        """在预先计算的前缀哈希上追加原文，得到缓存键"""
+        key_hash = prefix.copy()
+        key_hash.update(content.encode("utf-8"))
+        return key_hash.hexdigest()
+
+    @classmethod
+    def make_key(cls, content: str, target_language: str, terminology: Dict[str, str] = None) -> str:
+        """根据模型、目标语言、术语和原文生成缓存键"""
+        return cls.make_key_from_prefix(cls.make_key_prefix(target_language, terminology), content)
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，先查内存再查持久化缓存，过期条目视为未命中"""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                expires_at, translated_content = entry
+                if expires_at >= time.time():
+                    self._cache.move_to_end(key)
+                    return translated_content
+                del self._cache[key]
+
+        if self.persistent_cache is None:
+            return None
+        translated_content = self.persistent_cache.get(key)
+        if translated_content is not None:
+            # 持久化缓存命中后放入内存，后续直接读取
+            self._set_memory(key, translated_content)
+        return translated_content
+
+    def set(self, key: str, translated_content: str):
+        """写入缓存"""
+        self.set_many({key: translated_content})
+
+    def set_many(self, items: Dict[str, str]):
+        """批量写入缓存，持久化缓存在一个事务中写入"""
+        for key, translated_content in items.items():
+            self._set_memory(key, translated_content)
+        if self.persistent_cache is not None and items:
+            self.persistent_cache.set_many(items)
+
+    def _set_memory(self, key: str, translated_content: str):
+        """写入内存缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._cache[key] = (time.time() + self.ttl, translated_content)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def parallel_group_translate(
+        self,
+        chunk_groups: List[List[Chunk]],
+        target_language: str,
+        terminology: Dict[str, str] = None,
+        progress_callback: callable = None
+    ) -> List[TranslationResult]:
+        """
+        与 TranslationEngine.parallel_group_translate 接口一致。
+        先从缓存中取出已翻译过的块，只把未命中的块交给翻译引擎，最后按原顺序合并结果。
+        命中缓存的结果会先通过 progress_callback 报告一次（已完成组数为0）。
+        """
+        cached_results, missed_groups, keys = self._lookup(chunk_groups, target_language, terminology)
+        if progress_callback and cached_results:
+            progress_callback(0, len(missed_groups), list(cached_results.values()))
+
+        translated_results = []
+        if missed_groups:
+            translated_results = self.translation_engine.parallel_group_translate(
+                chunk_groups=missed_groups,
+                target_language=target_language,
+                terminology=terminology,
+                progress_callback=progress_callback
+            )
+        return self._merge(chunk_groups, cached_results, translated_results, keys)
+
+    async def parallel_group_translate_async(
+        self,
+        chunk_groups: List[List[Chunk]],
+        target_language: str,
+        terminology: Dict[str, str] = None,
+        progress_callback: callable = None
+    ) -> List[TranslationResult]:
+        """
+        与 TranslationEngine.parallel_group_translate_async 接口一致的异步版本。
+        """
+        cached_results, missed_groups, keys = await self._run_cache_operation(
+            self._lookup, chunk_groups, target_language, terminology
+        )
+        if progress_callback and cached_results:
+            progress_callback(0, len(missed_groups), list(cached_results.values()))
+
+        translated_results = []
+        if missed_groups:
+            translated_results = await self.translation_engine.parallel_group_translate_async(
+                chunk_groups=missed_groups,
+                target_language=target_language,
+                terminology=terminology,
+                progress_callback=progress_callback
+            )
+        return await self._run_cache_operation(self._merge, chunk_groups, cached_results, translated_results, keys)
+
+    async def _run_cache_operation(self, func, *args):
+        """
+        在异步路径中执行缓存查询或写入。
+        启用持久化缓存时SQLite读写可能因等待数据库锁而阻塞，放到线程中执行，避免卡住事件循环；
+        仅有内存缓存时直接调用。
+        """
+        if self.persistent_cache is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _lookup(self, chunk_groups: List[List[Chunk]], target_language: str, terminology: Dict[str, str] = None):
+        """
+        查询缓存，返回 (命中的结果, 未命中的分组, chunk_id到缓存键的映射)
+        """
+        cached_results = {}
+        missed_groups = []
+        keys = {}
+        key_prefix = self.make_key_prefix(target_language, terminology)
+
+        for group in chunk_groups:
+            missed_group = []
+            for chunk in group:
+                key = self.make_key_from_prefix(key_prefix, chunk.content)
+                keys[chunk.chunk_id] = key
+                translated_content = self.get(key)
+                if translated_content is None:
+                    missed_group.append(chunk)
+                else:
+                    cached_results[chunk.chunk_id] = TranslationResult(
+                        original_content=chunk.content,
+                        translated_content=translated_content,
+                        target_language=target_language,
+                        chunk_id=chunk.chunk_id,
+                        cached=True  # 命中缓存，未消耗模型token
+                    )
+            if missed_group:
+                missed_groups.append(missed_group)
+
+        self.logger.info("翻译缓存查询完成", {
+            "total_chunks": len(keys),
+            "cache_hits": len(cached_results),
+            "cache_misses": len(keys) - len(cached_results)
+        })
+        return cached_results, missed_groups, keys
+
+    def _merge(
+        self,
+        chunk_groups: List[List[Chunk]],
+        cached_results: Dict[int, TranslationResult],
+        translated_results: List[TranslationResult],
+        keys: Dict[int, str]
+    ) -> List[TranslationResult]:
+        """写入新翻译成功的结果，并按原始顺序合并缓存结果与新翻译结果"""
+        self.set_many({
+            keys[result.chunk_id]: result.translated_content
+            for result in translated_results
+            if result.success
+        })
+
+        results_by_id = {result.chunk_id: result for result in translated_results}
+        results_by_id.update(cached_results)
+        return [
+            results_by_id[chunk.chunk_id]
+            for group in chunk_groups
+            for chunk in group
+            if chunk.chunk_id in results_by_id
+        ]
 
 class TranslationService:
     """
@@ -15,7 +287,17 @@ class TranslationService:
         初始化翻译服务，加载所需的核心组件。
         """
         self.document_chunker = DocumentChunker()
+        self._chunk_process_pool = None  # 首次需要时创建，用于大文档分块
         self.translation_engine = TranslationEngine()
+        if config.TRANSLATION_CACHE_ENABLED:
+            # 使用缓存包装翻译引擎，重复的块不再调用LLM
+            persistent_cache = None
+            if config.TRANSLATION_CACHE_PATH:
+                persistent_cache = PersistentTranslationCache(
+                    config.TRANSLATION_CACHE_PATH,
+                    config.TRANSLATION_CACHE_DISK_TTL
+                )
+            self.translation_engine = CachedTranslator(self.translation_engine, persistent_cache=persistent_cache)
         self.logger = get_logger()
 
     def translate_document(self, content: str, target_language: str, terminology: dict = None) -> dict:
@@ -23,7 +305,7 @@ class TranslationService:
         执行完整的文档翻译流程。
         1. 分块 (Chunking)
         2. 分组 (Grouping)
-        3. 并行翻译 (Parallel Translation)
+        3. 并行翻译 (Parallel Translation)，命中缓存的块直接复用译文
         4. 结果组装 (Assembling)
         
         Args:
@@ -39,8 +321,8 @@ class TranslationService:
             chunks = self.document_chunker.chunk_document(content)
             self.logger.info(f"文档被分为 {len(chunks)} 个块")
 
-            # 2. 创建翻译组
-            chunk_groups = self.document_chunker.create_chunk_groups(chunks)
+            # 2. 创建翻译组，按token数均衡各组负载
+            chunk_groups = self.document_chunker.create_balanced_groups(chunks)
             self.logger.info(f"创建了 {len(chunk_groups)} 个翻译组")
 
             # 3. 并行翻译
@@ -52,26 +334,139 @@ class TranslationService:
             self.logger.info(f"完成了 {len(translation_results)} 个块的翻译")
 
             # 4. 组装最终输出
-            translated_parts = []
-            total_input_tokens = 0
-            total_output_tokens = 0
-
-            for result in translation_results:
-                if result.get('success'):
-                    translated_parts.append(result['translated_content'])
-                    total_input_tokens += result.get('input_tokens', 0)
-                    total_output_tokens += result.get('output_tokens', 0)
-                else:
-                    # 如果翻译失败，保留原文并添加错误提示
-                    error_info = result.get('error', '未知错误')
-                    translated_parts.append(f"【翻译失败: {error_info}】\n{result['original_content']}")
+            return self._assemble_output(translation_results)
+
+    async def translate_document_async(self, content: str, target_language: str, terminology: dict = None) -> dict:
+        """
+        translate_document 的异步版本。
+        分块和分组与同步版本相同，翻译阶段在事件循环中并发执行，不占用线程池。
+        
+        Args:
+            content (str): 需要翻译的文档内容。
+            target_language (str): 目标语言。
+            terminology (dict, optional): 术语词典。
             
-            final_output = "\n\n".join(translated_parts)
+        Returns:
+            dict: 包含翻译结果和统计信息的字典。
+        """
+        chunks = await self._chunk_document_async(content)
+        chunk_groups = self.document_chunker.create_balanced_groups(chunks)
+        self.logger.info(f"文档被分为 {len(chunks)} 个块，{len(chunk_groups)} 个翻译组")
+
+        translation_results = await self.translation_engine.parallel_group_translate_async(
+            chunk_groups=chunk_groups,
+            target_language=target_language,
+            terminology=terminology
+        )
+        self.logger.info(f"完成了 {len(translation_results)} 个块的翻译")
+
+        return self._assemble_output(translation_results)
+
+    async def translate_document_stream(self, content: str, target_language: str, terminology: dict = None) -> AsyncIterator[str]:
+        """
+        流式翻译文档：每当下一个连续的块翻译完成就按原文顺序输出，无需等待整篇文档翻译结束。
+        
+        Args:
+            content (str): 需要翻译的文档内容。
+            target_language (str): 目标语言。
+            terminology (dict, optional): 术语词典。
             
-            return {
-                "translated_content": final_output,
-                "usage": {
-                    "input_tokens": total_input_tokens,
-                    "output_tokens": total_output_tokens,
-                }
-            } 
\ No newline at end of file
+        Yields:
+            str: 按顺序输出的译文片段，片段之间已包含分隔的空行。
+        """
+        chunks = await self._chunk_document_async(content)
+        chunk_groups = self.document_chunker.create_balanced_groups(chunks)
+        self.logger.info(f"流式翻译：文档被分为 {len(chunks)} 个块，{len(chunk_groups)} 个翻译组")
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def on_group_done(completed_groups, total_groups, results):
+            queue.put_nowait(results)
+
+        translate_task = asyncio.create_task(self.translation_engine.parallel_group_translate_async(
+            chunk_groups=chunk_groups,
+            target_language=target_language,
+            terminology=terminology,
+            progress_callback=on_group_done
+        ))
+        # 翻译结束后放入结束标记，避免任务异常时一直等待队列
+        translate_task.add_done_callback(lambda _: queue.put_nowait(None))
+
+        # 重排缓冲区：chunk_id -> 已完成但还不能输出的结果
+        pending = {}
+        next_expected = 0
+        try:
+            while next_expected < len(chunks):
+                results = await queue.get()
+                if results is None:
+                    # 以最终结果补齐未通过回调报告的块
+                    results = [result for result in await translate_task if result.chunk_id >= next_expected]
+                for result in results:
+                    pending[result.chunk_id] = result
+                while next_expected in pending:
+                    segment = self._format_result(pending.pop(next_expected))
+                    yield segment if next_expected == 0 else "\n\n" + segment
+                    next_expected += 1
+                if translate_task.done() and not pending and queue.empty():
+                    break
+            # 等待翻译任务收尾（如写入缓存），提前退出时才取消
+            await translate_task
+        finally:
+            if not translate_task.done():
+                translate_task.cancel()
+
+    def close(self):
+        """
+        关闭分块进程池，服务停止时调用。
+        """
+        if self._chunk_process_pool is not None:
+            self._chunk_process_pool.shutdown()
+            self._chunk_process_pool = None
+
+    async def _chunk_document_async(self, content: str) -> List[Chunk]:
+        """
+        异步路径的文档分块。大文档的分词与切分交给进程池执行，避免阻塞事件循环和其他请求；
+        小文档或关闭进程池（CHUNK_PROCESS_WORKERS=0）时直接在当前进程中分块。
+        """
+        if config.CHUNK_PROCESS_WORKERS <= 0 or len(content) < config.CHUNK_PROCESS_MIN_CHARS:
+            return self.document_chunker.chunk_document(content)
+        if self._chunk_process_pool is None:
+            self._chunk_process_pool = ProcessPoolExecutor(
+                max_workers=config.CHUNK_PROCESS_WORKERS, **process_pool_options()
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._chunk_process_pool, chunk_document_in_process, content)
+
+    def _format_result(self, result: TranslationResult) -> str:
+        """
+        将单个块的翻译结果转换为输出文本，失败的块保留原文并添加错误提示。
+        """
+        if result.success:
+            return result.translated_content
+        error_info = result.error or '未知错误'
+        return f"【翻译失败: {error_info}】\n{result.original_content}"
+
+    def _assemble_output(self, translation_results: List[TranslationResult]) -> dict:
+        """
+        将各块的翻译结果按顺序写入缓冲区拼接为最终输出，并统计token用量。
+        """
+        output = io.StringIO()
+        total_input_tokens = 0
+        total_output_tokens = 0
+
+        # 均衡分组会打乱组间顺序，按块ID恢复原文顺序
+        for index, result in enumerate(sorted(translation_results, key=lambda r: r.chunk_id)):
+            if index:
+                output.write("\n\n")
+            output.write(self._format_result(result))
+            if result.success:
+                total_input_tokens += result.input_tokens
+                total_output_tokens += result.output_tokens
+        
+        return {
+            "translated_content": output.getvalue(),
+            "usage": {
+                "input_tokens": total_input_tokens,
+                "output_tokens": total_output_tokens,
+            }
+        }
@@ -1,67 +1,170 @@
 """
-简单的内存任务管理器
+基于SQLite的任务管理器
 用于跟踪后台翻译任务的状态和结果。
+任务状态持久化在数据库文件中，多个worker进程可共享，服务重启后也不会丢失。
 """
-import uuid
-from typing import Dict, Any, Literal
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Literal, Optional
+from config import config
 
 # 定义任务状态的类型
 TaskStatus = Literal["pending", "running", "completed", "failed"]
 
 class TaskManager:
     """
-    一个简单的内存任务管理器。
-    注意：这是一个基础实现，服务重启后任务状态会丢失。
+    基于SQLite的任务管理器。
+    每个任务带有过期时间（默认24小时），过期任务在创建新任务时被清理，内存占用与任务数量无关。
     """
-    def __init__(self):
-        self._tasks: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, db_path: str = None, ttl: int = None):
+        """
+        Args:
+            db_path (str, optional): 数据库文件路径，默认取配置中的TASK_DB_PATH。
+            ttl (int, optional): 任务保留时间（秒），默认取配置中的TASK_TTL。
+        """
+        self.db_path = db_path or config.TASK_DB_PATH
+        self.ttl = ttl if ttl is not None else config.TASK_TTL
+        self.lease_seconds = config.TASK_LEASE_SECONDS
+        # 当前worker的标识；任务由持有有效租约的worker执行，其他worker不会重复执行
+        self.owner_id = secrets.token_hex(8)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        # sqlite连接不能跨线程使用，每个线程持有自己的连接
+        self._local = threading.local()
+        conn = self._get_connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                request_data TEXT,
+                expires_at REAL NOT NULL,
+                owner TEXT,
+                lease_expires REAL
+            )
+        """)
+        # 兼容旧版本创建的数据库，补充任务归属相关的列
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        for column, column_type in (("owner", "TEXT"), ("lease_expires", "REAL")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {column_type}")
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _update(self, task_id: str, **fields):
+        """
+        更新任务字段。只有任务的持有者（或无人持有时）才能更新，
+        租约已被其他worker接管的旧执行者不会覆盖新持有者写入的状态和结果。
+        任务不存在或已被其他worker持有时抛出KeyError。
+        """
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        cursor = self._get_connection().execute(
+            f"UPDATE tasks SET {assignments}, expires_at = ? WHERE task_id = ? AND (owner IS NULL OR owner = ?)",
+            (*fields.values(), time.time() + self.ttl, task_id, self.owner_id)
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(f"Task with ID '{task_id}' not found or owned by another worker.")
 
     def create_task(self, request_data: Dict[str, Any] = None) -> str:
         """
         创建一个新任务并返回其ID。
         """
-        task_id = str(uuid.uuid4())
-        self._tasks[task_id] = {
-            "status": "pending",
-            "result": None,
-            "error": None,
-            "request_data": request_data or {}
-        }
+        # 32位十六进制ID，与uuid4().hex格式一致，但无需构造UUID对象
+        task_id = secrets.token_hex(16)
+        conn = self._get_connection()
+        # 顺便清理已过期的任务
+        conn.execute("DELETE FROM tasks WHERE expires_at < ?", (time.time(),))
+        # 创建任务的worker即为执行者，直接持有租约
+        now = time.time()
+        conn.execute(
+            "INSERT INTO tasks (task_id, status, result, error, request_data, expires_at, owner, lease_expires) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (task_id, "pending", None, None, json.dumps(request_data or {}, ensure_ascii=False), now + self.ttl,
+             self.owner_id, now + self.lease_seconds)
+        )
         return task_id
 
+    def claim_task(self, task_id: str) -> bool:
+        """
+        尝试接管一个未完成的任务。
+        仅当任务无人持有或原持有者的租约已过期时才能接管，判断与写入在同一条UPDATE中完成，多个worker同时接管时只有一个成功。
+        """
+        now = time.time()
+        cursor = self._get_connection().execute(
+            "UPDATE tasks SET owner = ?, lease_expires = ? "
+            "WHERE task_id = ? AND status IN ('pending', 'running') AND expires_at >= ? "
+            "AND (owner IS NULL OR lease_expires IS NULL OR lease_expires < ?)",
+            (self.owner_id, now + self.lease_seconds, task_id, now, now)
+        )
+        return cursor.rowcount == 1
+
+    def renew_lease(self, task_id: str) -> bool:
+        """
+        续期当前worker持有的任务租约，执行中的任务需定期调用。
+        返回False表示租约已被其他worker接管。
+        """
+        cursor = self._get_connection().execute(
+            "UPDATE tasks SET lease_expires = ? WHERE task_id = ? AND owner = ?",
+            (time.time() + self.lease_seconds, task_id, self.owner_id)
+        )
+        return cursor.rowcount == 1
+
     def set_status(self, task_id: str, status: TaskStatus):
         """
         设置任务的状态。
         """
-        if task_id in self._tasks:
-            self._tasks[task_id]["status"] = status
-        else:
-            raise KeyError(f"Task with ID '{task_id}' not found.")
+        self._update(task_id, status=status)
 
     def set_result(self, task_id: str, result: Any):
         """
         为已完成的任务设置结果。
         """
-        if task_id in self._tasks:
-            self._tasks[task_id]["result"] = result
-            self.set_status(task_id, "completed")
-        else:
-            raise KeyError(f"Task with ID '{task_id}' not found.")
+        self._update(task_id, result=json.dumps(result, ensure_ascii=False), status="completed")
 
     def set_error(self, task_id: str, error_message: str):
         """
         为失败的任务设置错误信息。
         """
-        if task_id in self._tasks:
-            self._tasks[task_id]["error"] = error_message
-            self.set_status(task_id, "failed")
-        else:
-            raise KeyError(f"Task with ID '{task_id}' not found.")
+        self._update(task_id, error=error_message, status="failed")
 
-    def get_task(self, task_id: str) -> Dict[str, Any]:
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
         """
         获取任务的完整信息（状态、结果、错误）。
         """
-        if task_id in self._tasks:
-            return self._tasks[task_id]
-        return None 
\ No newline at end of file
+        row = self._get_connection().execute(
+            "SELECT status, result, error, request_data FROM tasks WHERE task_id = ? AND expires_at >= ?",
+            (task_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        status, result, error, request_data = row
+        return {
+            "status": status,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "request_data": json.loads(request_data) if request_data else {}
+        }
+
+    def get_unfinished_tasks(self) -> List[str]:
+        """
+        获取尚未完成（pending/running）且无人持有有效租约的任务ID，供重启后的worker恢复执行。
+        恢复前需先调用claim_task接管任务。
+        """
+        now = time.time()
+        rows = self._get_connection().execute(
+            "SELECT task_id FROM tasks WHERE status IN ('pending', 'running') AND expires_at >= ? "
+            "AND (owner IS NULL OR lease_expires IS NULL OR lease_expires < ?)",
+            (now, now)
+        ).fetchall()
+        return [row[0] for row in rows]
@@ -2,6 +2,8 @@
 翻译Agent配置文件
 """
 import os
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, List
 from dotenv import load_dotenv
 
@@ -9,7 +11,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
-    """配置管理类"""
+    """
+    配置管理类
+    集合类配置使用元组和只读映射，避免运行时被意外修改。
+    """
     
     # OpenAI API配置
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
@@ -20,12 +25,14 @@ class Config:
     DEFAULT_MODEL = "Qwen3-30B-A3B"
     LLM_MODEL = DEFAULT_MODEL  # 添加LLM_MODEL别名
     MAX_TOKENS = 48000  # GPT-4 Turbo的最大token数
+    SAFE_TOKEN_RATIO = 0.8  # 单段文本可占用模型最大上下文的安全比例
+    TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "4096"))  # token计数缓存的最大条目数
     
     # 分块策略配置
-    # CHUNK_TOKEN_LIMIT = 500  # 固定的chunk token限制
-    # TOKEN_THRESHOLD = CHUNK_TOKEN_LIMIT  # 添加TOKEN_THRESHOLD别名
+    CHUNK_TOKEN_LIMIT = 500  # 固定的chunk token限制
+    TOKEN_THRESHOLD = CHUNK_TOKEN_LIMIT  # 添加TOKEN_THRESHOLD别名
     GROUP_TOKEN_RATIO = 0.35  # 分组token占模型最大上下文的比例
-    CHUNK_SEPARATORS = [
+    CHUNK_SEPARATORS = (
         "\n# ",      # 一级标题
         "\n## ",     # 二级标题
         "\n### ",    # 三级标题
@@ -40,25 +47,55 @@ class Config:
         "?",         # 英文问号
         "！",        # 中文感叹号
         "!",         # 英文感叹号
-    ]
+    )
     
     # 并行翻译配置
     DEFAULT_GROUP_SIZE = 4  # 默认每组chunk数量
     PARALLEL_GROUP_SIZE = DEFAULT_GROUP_SIZE  # 添加PARALLEL_GROUP_SIZE别名
     MIN_GROUP_SIZE = 1  # 最小组大小
     MAX_PARALLEL_GROUPS = int(os.getenv("MAX_PARALLEL_GROUPS", "10"))  # 最大并行组数
+    MAX_PARALLEL_CHUNKS = int(os.getenv("MAX_PARALLEL_CHUNKS", str(MAX_PARALLEL_GROUPS * 2)))  # 异步翻译时同时进行的最大块请求数
+    GROUP_BATCH_TRANSLATION = os.getenv("GROUP_BATCH_TRANSLATION", "True").lower() == "true"  # 组内多个块合并为一次请求，解析失败时退回逐块翻译
+    CHUNK_PROCESS_WORKERS = int(os.getenv("CHUNK_PROCESS_WORKERS", str(os.cpu_count() or 1)))  # 分块子进程数，0表示在当前进程中分块
+    CHUNK_PROCESS_MIN_CHARS = int(os.getenv("CHUNK_PROCESS_MIN_CHARS", "100000"))  # 文档字符数达到该值才交给子进程分块
     
+    # 意图识别配置
+    # 意图识别只是简单分类，可部署小模型单独提供服务；未配置时沿用翻译模型和接口
+    INTENT_MODEL = os.getenv("INTENT_MODEL", DEFAULT_MODEL)
+    INTENT_BASE_URL = os.getenv("INTENT_BASE_URL", OPENAI_BASE_URL)
+    INTENT_RULES_ENABLED = os.getenv("INTENT_RULES_ENABLED", "True").lower() == "true"  # 意图明确时跳过大模型调用
+    INTENT_MAX_TOKENS = int(os.getenv("INTENT_MAX_TOKENS", "512"))  # 意图识别最大输出token数
+    
+    # 提示词前缀缓存配置
+    # OpenAI/vLLM会自动复用相同前缀的KV缓存；对需要显式标记的服务（如Anthropic兼容网关）可开启cache_control标记
+    PROMPT_CACHE_CONTROL = os.getenv("PROMPT_CACHE_CONTROL", "False").lower() == "true"
+    
+    # 翻译缓存配置
+    TRANSLATION_CACHE_ENABLED = os.getenv("TRANSLATION_CACHE_ENABLED", "True").lower() == "true"
+    TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", str(24 * 3600)))  # 缓存有效期（秒）
+    TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "10000"))  # 内存缓存最大条目数
+    TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", "data/translation_cache.db")  # 持久化缓存文件，置空则只使用内存缓存
+    TRANSLATION_CACHE_DISK_TTL = int(os.getenv("TRANSLATION_CACHE_DISK_TTL", str(7 * 24 * 3600)))  # 持久化缓存有效期（秒）
+    
+    # 任务存储配置
+    TASK_DB_PATH = os.getenv("TASK_DB_PATH", "data/tasks.db")  # 任务状态数据库，多个worker共享
+    TASK_TTL = int(os.getenv("TASK_TTL", "86400"))  # 任务保留时间（秒）
+    TASK_RESUME_ON_STARTUP = os.getenv("TASK_RESUME_ON_STARTUP", "False").lower() == "true"  # 启动时恢复未完成的任务
+    TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", "60"))  # 任务租约时长（秒），执行中的worker定期续期，过期后其他worker才能接管
     
     # 日志配置
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
     LOG_DIR = os.getenv("LOG_DIR", "logs")
+    LOG_PRETTY_JSON = os.getenv("LOG_PRETTY_JSON", "False").lower() == "true"  # 日志中的JSON缩进输出，便于人工阅读
     
     # 文件支持格式
-    SUPPORTED_FORMATS = [".md", ".txt", ".pdf", ".docx", ".html"]
+    SUPPORTED_FORMATS = (".md", ".txt", ".pdf", ".docx", ".html")
+    PDF_PROCESS_WORKERS = int(os.getenv("PDF_PROCESS_WORKERS", str(os.cpu_count() or 1)))  # PDF并行提取文本的子进程数，1表示不并行
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))  # PDF页数超过该值才使用多进程提取；页数较少时进程间通信开销超过并行收益
     
     # 系统提示词
-    SYSTEM_PROMPTS = {   
+    SYSTEM_PROMPTS = MappingProxyType({   
 "group_translation": """You are a professional translator specializing in document translation. Your task is to translate the following content into {target_language} while maintaining the highest quality and accuracy.
 
 ## Translation Guidelines:
@@ -102,8 +139,23 @@ class Config:
 
 Please translate the following content into {target_language}:
 
+""",
+"batch_instruction": """The content below consists of {chunk_count} segments, each wrapped in markers like <<<CHUNK n>>> ... <<<END n>>>.
+Translate every segment separately and keep all markers exactly as they are, in the same order. Output nothing outside the markers.
+
 """
-    }
+    })
+
+@lru_cache(maxsize=64)
+def get_group_prompt(target_language: str, terminology_info: str) -> str:
+    """
+    格式化组翻译的系统提示
+    相同的目标语言和术语信息只格式化一次，后续直接复用缓存结果。
+    """
+    return Config.SYSTEM_PROMPTS["group_translation"].format(
+        target_language=target_language,
+        terminology_info=terminology_info
+    )
 
 # 全局配置实例
 config = Config() 
\ No newline at end of file
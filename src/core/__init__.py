@@ -3,8 +3,11 @@
 """
 from .document_chunker import DocumentChunker
 from .translation_engine import TranslationEngine
+from .models import Chunk, TranslationResult
 
 __all__ = [
     "DocumentChunker", 
-    "TranslationEngine"
+    "TranslationEngine",
+    "Chunk",
+    "TranslationResult"
 ] 
\ No newline at end of file
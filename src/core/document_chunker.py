@@ -1,11 +1,15 @@
 """
 文档分块模块
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
+import heapq
+import logging
+import math
 import re
 from config import config
 from utils.tokenizer import token_calculator
 from utils.logger import get_logger
+from .models import Chunk
 
 class DocumentChunker:
     """文档分块器"""
@@ -14,8 +18,9 @@ class DocumentChunker:
         self.token_calculator = token_calculator
         self.max_chunk_tokens = config.CHUNK_TOKEN_LIMIT  # 使用固定的500 tokens
         self.logger = get_logger()
+        self.separator_levels = self._build_separator_levels(config.CHUNK_SEPARATORS)
     
-    def chunk_document(self, content: str) -> List[Dict[str, Any]]:
+    def chunk_document(self, content: str) -> List[Chunk]:
         """
         对文档进行分块
         
@@ -23,11 +28,16 @@ class DocumentChunker:
             content: 文档内容
             
         Returns:
-            分块列表，每个块包含 {'content': str, 'tokens': int, 'chunk_id': int}
+            分块列表（Chunk），每个块包含 content、tokens、chunk_id
         """
         with self.logger.step("document_chunking", "文档分块处理"):
-            # 计算文档总token数
-            total_tokens = self.token_calculator.count_tokens(content)
+            # 计算文档总token数；估算值已远超限制时必然需要分块，跳过对整篇文档的精确编码
+            estimated_tokens = self.token_calculator.estimate_tokens(content)
+            if self._is_clearly_oversized(estimated_tokens):
+                tokens, total_tokens = None, estimated_tokens
+            else:
+                # 保留编码结果，后续切分时复用
+                tokens, total_tokens = self.token_calculator.encode_and_count(content)
             
             self.logger.info("开始文档分块", {
                 "content_length": len(content),
@@ -41,12 +51,7 @@ class DocumentChunker:
                     "decision": "complete_document",
                     "reason": f"总token数({total_tokens}) <= 最大限制({self.max_chunk_tokens})"
                 })
-                return [{
-                    'content': content,
-                    'tokens': total_tokens,
-                    'chunk_id': 0,
-                    'type': 'complete'
-                }]
+                return [Chunk(content=content, tokens=total_tokens, chunk_id=0, type='complete')]
             
             # 需要分块处理
             self.logger.info("文档需要分块处理", {
@@ -54,103 +59,45 @@ class DocumentChunker:
                 "reason": f"总token数({total_tokens}) > 最大限制({self.max_chunk_tokens})"
             })
             
-            chunks = []
-            used_separator = None
-            
-            # 按照配置的分隔符层次分块
-            for separator in config.CHUNK_SEPARATORS:
-                if separator in content:
-                    self.logger.debug("尝试使用分隔符分块", {
-                        "separator": repr(separator),
-                        "separator_count": content.count(separator)
-                    })
-                    chunks = self._split_by_separator(content, separator)
-                    used_separator = separator
-                    break
-            
-            # 如果没有找到合适的分隔符，按字符分块
-            if not chunks:
-                self.logger.info("未找到合适分隔符，使用长度分块", {
-                    "method": "length_based_chunking"
-                })
-                chunks = self._split_by_length(content)
-                used_separator = "length_based"
-            
-            self.logger.info("初步分块完成", {
-                "separator_used": used_separator,
-                "initial_chunks": len(chunks),
-                "chunk_sizes": [len(chunk) for chunk in chunks[:5]]  # 只记录前5个的大小
+            # 第一遍：沿分隔符层级递归切分，直到每个片段都不超过限制
+            segments = self._recursive_split(content, self.separator_levels, tokens=tokens, oversized=True)
+            self.logger.info("递归切分完成", {
+                "segment_count": len(segments)
             })
             
-            # 为每个块添加元数据
-            result_chunks = []
-            for i, chunk_content in enumerate(chunks):
-                chunk_tokens = self.token_calculator.count_tokens(chunk_content)
-                result_chunks.append({
-                    'content': chunk_content,
-                    'tokens': chunk_tokens,
-                    'chunk_id': i,
-                    'type': 'chunk'
-                })
+            # 第二遍：将相邻的小片段合并，使每块尽量接近限制
+            final_chunks = [
+                Chunk(content=chunk_content, tokens=chunk_tokens, chunk_id=chunk_id)
+                for chunk_id, (chunk_content, chunk_tokens) in enumerate(self._merge_segments(segments))
+            ]
             
-            # 记录token分布
-            token_distribution = [chunk['tokens'] for chunk in result_chunks]
-            self.logger.info("分块token分布", {
-                "chunk_count": len(result_chunks),
-                "token_distribution": token_distribution,
-                "max_tokens": max(token_distribution) if token_distribution else 0,
-                "min_tokens": min(token_distribution) if token_distribution else 0,
-                "avg_tokens": sum(token_distribution) / len(token_distribution) if token_distribution else 0
-            })
-            
-            # 如果某个块仍然过大，继续分割
-            final_chunks = []
-            oversized_chunks = 0
-            for chunk in result_chunks:
-                if chunk['tokens'] > self.max_chunk_tokens:
-                    oversized_chunks += 1
-                    self.logger.debug("发现超大块，进行二次分割", {
-                        "chunk_id": chunk['chunk_id'],
-                        "chunk_tokens": chunk['tokens'],
-                        "max_allowed": self.max_chunk_tokens
-                    })
-                    sub_chunks = self._split_large_chunk(chunk['content'])
-                    for j, sub_chunk in enumerate(sub_chunks):
-                        final_chunks.append({
-                            'content': sub_chunk,
-                            'tokens': self.token_calculator.count_tokens(sub_chunk),
-                            'chunk_id': len(final_chunks),
-                            'type': 'sub_chunk'
-                        })
-                else:
-                    final_chunks.append(chunk)
-            
-            if oversized_chunks > 0:
-                self.logger.info("完成二次分割", {
-                    "oversized_chunks": oversized_chunks,
-                    "final_chunk_count": len(final_chunks)
-                })
-            
-            # 最终统计
-            final_token_distribution = [chunk['tokens'] for chunk in final_chunks]
+            # 最终统计（逐块token分布仅在调试级别构造）
             self.logger.info("分块处理完成", {
                 "final_chunk_count": len(final_chunks),
-                "total_tokens": sum(final_token_distribution),
-                "max_chunk_tokens": max(final_token_distribution) if final_token_distribution else 0,
                 "processing_strategy": "chunked" if len(final_chunks) > 1 else "single"
             })
+            if self.logger.is_enabled_for(logging.DEBUG):
+                final_token_distribution = [chunk.tokens for chunk in final_chunks]
+                self.logger.debug("分块token分布", {
+                    "token_distribution": final_token_distribution,
+                    "total_tokens": sum(final_token_distribution),
+                    "max_chunk_tokens": max(final_token_distribution),
+                    "min_chunk_tokens": min(final_token_distribution)
+                })
             
             return final_chunks
     
-    def create_chunk_groups(self, chunks: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    def create_chunk_groups(self, chunks: List[Chunk]) -> List[List[Chunk]]:
         """
         将chunks分组用于并行翻译
         每组最多包含4个连续chunk，但要确保不超过模型最大上下文的35%
         """
         with self.logger.step("chunk_grouping", "创建分组用于并行翻译"):
             groups = []
+            group_tokens_list = []  # 与groups一一对应的组内token数，分组时顺便累计
             current_group = []
             current_group_tokens = 0
+            debug_enabled = self.logger.is_enabled_for(logging.DEBUG)
             max_group_tokens = int(config.MAX_TOKENS * config.GROUP_TOKEN_RATIO)
             
             self.logger.info("开始分组", {
@@ -160,7 +107,7 @@ class DocumentChunker:
             })
             
             for chunk in chunks:
-                chunk_tokens = chunk['tokens']
+                chunk_tokens = chunk.tokens
                 
                 # 检查是否可以加入当前组
                 if (len(current_group) < config.DEFAULT_GROUP_SIZE and 
@@ -171,11 +118,13 @@ class DocumentChunker:
                     # 当前组已满或加入新chunk会超过token限制
                     if current_group:
                         groups.append(current_group)
-                        self.logger.debug("完成一个分组", {
-                            "group_id": len(groups) - 1,
-                            "group_size": len(current_group),
-                            "group_tokens": current_group_tokens
-                        })
+                        group_tokens_list.append(current_group_tokens)
+                        if debug_enabled:
+                            self.logger.debug("完成一个分组", {
+                                "group_id": len(groups) - 1,
+                                "group_size": len(current_group),
+                                "group_tokens": current_group_tokens
+                            })
                     
                     # 开始新组
                     current_group = [chunk]
@@ -184,93 +133,212 @@ class DocumentChunker:
             # 添加最后一组
             if current_group:
                 groups.append(current_group)
-                self.logger.debug("完成最后一个分组", {
-                    "group_id": len(groups) - 1,
-                    "group_size": len(current_group),
-                    "group_tokens": current_group_tokens
-                })
+                group_tokens_list.append(current_group_tokens)
+                if debug_enabled:
+                    self.logger.debug("完成最后一个分组", {
+                        "group_id": len(groups) - 1,
+                        "group_size": len(current_group),
+                        "group_tokens": current_group_tokens
+                    })
             
             self.logger.info("分组完成", {
-                "total_groups": len(groups),
-                "group_sizes": [len(group) for group in groups],
-                "group_tokens": [sum(chunk['tokens'] for chunk in group) for group in groups]
+                "total_groups": len(groups)
             })
+            self._log_group_distribution(groups, group_tokens_list)
             
             return groups
     
-    def _split_by_separator(self, content: str, separator: str) -> List[str]:
-        """按分隔符分割文档"""
-        if separator.startswith('\n#'):
-            # 处理标题分隔符
-            parts = content.split(separator)
-            chunks = []
-            for i, part in enumerate(parts):
-                if i == 0:
-                    chunks.append(part)
-                else:
-                    chunks.append(separator + part)
-            return [chunk.strip() for chunk in chunks if chunk.strip()]
-        else:
-            # 处理其他分隔符
-            return [chunk.strip() for chunk in content.split(separator) if chunk.strip()]
+    def create_balanced_groups(self, chunks: List[Chunk]) -> List[List[Chunk]]:
+        """
+        按token数均衡地将chunks分组用于并行翻译
+        组数与 create_chunk_groups 相当，但按token从大到小依次放入当前token最少的组，
+        使各组耗时接近，避免个别大组拖慢整体完成时间。组内chunk保持原文顺序。
+        """
+        with self.logger.step("chunk_grouping", "创建均衡分组用于并行翻译"):
+            if not chunks:
+                return []
+            
+            max_group_tokens = int(config.MAX_TOKENS * config.GROUP_TOKEN_RATIO)
+            total_tokens = sum(chunk.tokens for chunk in chunks)
+            group_count = max(
+                math.ceil(len(chunks) / config.DEFAULT_GROUP_SIZE),
+                math.ceil(total_tokens / max_group_tokens)
+            )
+            
+            groups = [[] for _ in range(group_count)]
+            # 小顶堆：(组内token数, 组索引)
+            heap = [(0, i) for i in range(group_count)]
+            
+            for chunk in sorted(chunks, key=lambda c: c.tokens, reverse=True):
+                group_tokens, group_index = heapq.heappop(heap)
+                if group_tokens and group_tokens + chunk.tokens > max_group_tokens:
+                    # 最空的组也放不下，新开一组
+                    heapq.heappush(heap, (group_tokens, group_index))
+                    group_tokens, group_index = 0, len(groups)
+                    groups.append([])
+                groups[group_index].append(chunk)
+                heapq.heappush(heap, (group_tokens + chunk.tokens, group_index))
+            
+            # 堆中已记录每组的最终token数，无需再对各组求和
+            tokens_by_index = {group_index: group_tokens for group_tokens, group_index in heap}
+            group_tokens_list = [tokens_by_index[i] for i, group in enumerate(groups) if group]
+            groups = [sorted(group, key=lambda c: c.chunk_id) for group in groups if group]
+            
+            self.logger.info("均衡分组完成", {
+                "total_chunks": len(chunks),
+                "max_group_tokens": max_group_tokens,
+                "total_groups": len(groups)
+            })
+            self._log_group_distribution(groups, group_tokens_list)
+            
+            return groups
+    
+    def _log_group_distribution(self, groups: List[List[Chunk]], group_tokens: List[int]):
+        """调试级别下记录每组的块数与token数，group_tokens 为分组时累计的各组token数"""
+        if not self.logger.is_enabled_for(logging.DEBUG):
+            return
+        self.logger.debug("分组分布", {
+            "group_sizes": [len(group) for group in groups],
+            "group_tokens": group_tokens
+        })
+    
+    def _is_clearly_oversized(self, estimated_tokens: int) -> bool:
+        """估算token数超过限制4倍时，无需精确编码即可判定必须切分"""
+        return estimated_tokens > self.max_chunk_tokens * 4
+    
+    @staticmethod
+    def _build_separator_levels(separators) -> tuple:
+        """
+        构建切分层级：标题、段落、换行等分隔符各占一层；
+        句末标点（单字符非空白分隔符）互为同级，合并为一个预编译正则，一次扫描即可全部切开。
+        """
+        levels = []
+        punctuation = []
+        for separator in separators:
+            if len(separator) == 1 and not separator.isspace():
+                if not punctuation:
+                    levels.append(None)  # 占位，保持句末标点层在原配置中的位置
+                punctuation.append(separator)
+            else:
+                levels.append(separator)
+        if punctuation:
+            # 零宽切分点位于标点之后，标点保留在前一段末尾
+            pattern = re.compile("(?<=[" + re.escape("".join(punctuation)) + "])")
+            levels[levels.index(None)] = pattern
+        return tuple(levels)
     
-    def _split_by_length(self, content: str, max_length: int = None) -> List[str]:
-        """按长度分割文档"""
-        if max_length is None:
-            max_length = self.max_chunk_tokens * 3  # 估算字符数
+    def _recursive_split(self, content: str, separators, tokens: List[int] = None,
+                         oversized: bool = False) -> List[Tuple[str, int]]:
+        """
+        递归切分文本，返回 (片段, token数) 列表
+        片段不超过限制时直接返回；否则用第一个出现的分隔符切分，只对仍然超限的片段继续用更细的分隔符切分；
+        所有分隔符都用完仍超限时按token数强制切分。片段保留分隔符，按顺序拼接即可还原原文。
         
-        chunks = []
-        current_pos = 0
+        Args:
+            content: 待切分的文本
+            separators: 可用的切分层级（分隔符字符串或预编译正则），按粒度从粗到细排列
+            tokens: content 已有的编码结果（可选）
+            oversized: 调用方已确定 content 超限时为True，此时跳过编码；
+                没有任何分隔符时才编码一次并直接按token切分
+        """
+        if tokens is not None:
+            if len(tokens) <= self.max_chunk_tokens:
+                return [(content, len(tokens))]
+        elif not oversized:
+            tokens, token_count = self.token_calculator.encode_and_count(content)
+            if token_count <= self.max_chunk_tokens:
+                return [(content, token_count)]
         
-        while current_pos < len(content):
-            end_pos = min(current_pos + max_length, len(content))
-            chunk = content[current_pos:end_pos]
-            chunks.append(chunk)
-            current_pos = end_pos
+        for i, separator in enumerate(separators):
+            # 直接切分：未出现分隔符时split只扫描一遍并返回原串，无需先用in再扫描一遍
+            parts = self._split_by_separator(content, separator)
+            if len(parts) < 2:
+                continue
+            # 估算值已远超限制的片段必然继续切分，不做编码；其余片段一次批量编码
+            oversized_flags = [
+                self._is_clearly_oversized(self.token_calculator.estimate_tokens(part)) for part in parts
+            ]
+            to_encode = [part for part, is_oversized in zip(parts, oversized_flags) if not is_oversized]
+            encoded = iter(self.token_calculator.encode_batch(to_encode) if to_encode else ())
+            segments = []
+            for part, is_oversized in zip(parts, oversized_flags):
+                if is_oversized:
+                    segments.extend(self._recursive_split(part, separators[i + 1:], oversized=True))
+                else:
+                    segments.extend(self._recursive_split(part, separators[i + 1:], tokens=next(encoded)))
+            return segments
         
-        return chunks
+        return self._force_split_by_tokens(content, tokens)
     
-    def _split_large_chunk(self, content: str) -> List[str]:
-        """分割过大的块"""
-        # 使用更细粒度的分隔符
-        fine_separators = ["\n\n", "\n", "。", ".", "？", "?", "！", "!"]
+    def _merge_segments(self, segments: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+        """
+        合并相邻片段，每块累计token数不超过限制；合并后的token数直接由各片段相加得到，不再重新编码
+        """
+        chunks = []
+        current_parts = []
+        current_tokens = 0
         
-        for separator in fine_separators:
-            if separator in content:
-                parts = self._split_by_separator(content, separator)
-                # 检查分割后的结果
-                valid_parts = []
-                for part in parts:
-                    if self.token_calculator.count_tokens(part) <= self.max_chunk_tokens:
-                        valid_parts.append(part)
-                    else:
-                        # 如果还是太大，强制按token数分割
-                        valid_parts.extend(self._force_split_by_tokens(part))
-                
-                if len(valid_parts) > 1:
-                    return valid_parts
+        def flush():
+            chunk_content = "".join(current_parts).strip()
+            if chunk_content:
+                chunks.append((chunk_content, current_tokens))
         
-        # 如果都不行，强制按token数分割
-        return self._force_split_by_tokens(content)
-    
-    def _force_split_by_tokens(self, content: str) -> List[str]:
-        """强制按token数分割"""
-        tokens = self.token_calculator.encoding.encode(content)
-        chunks = []
+        for segment, segment_tokens in segments:
+            if current_parts and current_tokens + segment_tokens > self.max_chunk_tokens:
+                flush()
+                current_parts = []
+                current_tokens = 0
+            current_parts.append(segment)
+            current_tokens += segment_tokens
         
-        current_pos = 0
-        while current_pos < len(tokens):
-            end_pos = min(current_pos + self.max_chunk_tokens, len(tokens))
-            chunk_tokens = tokens[current_pos:end_pos]
-            chunk_content = self.token_calculator.encoding.decode(chunk_tokens)
-            chunks.append(chunk_content)
-            current_pos = end_pos
+        if current_parts:
+            flush()
         
         return chunks
     
-    def estimate_processing_time(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _split_by_separator(self, content: str, separator) -> List[str]:
+        """
+        按分隔符分割文档，保留分隔符以便合并时还原原文
+        标题分隔符归属到后一段（标题行开头），其他分隔符归属到前一段（句末标点、换行）
+        separator 为预编译正则时按零宽切分点一次切分所有句末标点
+        """
+        if not isinstance(separator, str):
+            return [piece for piece in separator.split(content) if piece]
+        position = content.find(separator)
+        if position == -1:
+            return [content]
+        # 按分隔符位置直接切片原文，每个片段只分配一次，无需先split再拼接分隔符
+        separator_length = len(separator)
+        attach_to_next = separator.startswith('\n#')
+        pieces = []
+        start = 0
+        while position != -1:
+            end = position if attach_to_next else position + separator_length
+            if end > start:
+                pieces.append(content[start:end])
+                start = end
+            position = content.find(separator, position + separator_length)
+        if start < len(content):
+            pieces.append(content[start:])
+        return pieces
+    
+    def _force_split_by_tokens(self, content: str, tokens: List[int] = None) -> List[Tuple[str, int]]:
+        """
+        强制按token数分割，返回 (片段, token数) 列表
+        已有编码结果时可通过 tokens 传入，避免重复编码。
+        """
+        encoding = self.token_calculator.encoding
+        if tokens is None:
+            tokens = encoding.encode(content)
+        step = self.max_chunk_tokens
+        slices = [tokens[i:i + step] for i in range(0, len(tokens), step)]
+        # decode_batch 在线程池中并行解码（tiktoken 解码时释放GIL）
+        texts = encoding.decode_batch(slices)
+        return [(text, len(chunk_tokens)) for text, chunk_tokens in zip(texts, slices)]
+    
+    def estimate_processing_time(self, chunks: List[Chunk]) -> Dict[str, Any]:
         """估算处理时间"""
-        total_tokens = sum(chunk['tokens'] for chunk in chunks)
+        total_tokens = sum(chunk.tokens for chunk in chunks)
         estimated_seconds = len(chunks) * 30  # 假设每个块需要30秒
         
         return {
@@ -278,4 +346,17 @@ class DocumentChunker:
             'total_tokens': total_tokens,
             'estimated_seconds': estimated_seconds,
             'estimated_minutes': estimated_seconds / 60
-        } 
\ No newline at end of file
+        }
+
+# 子进程内复用的分块器实例
+_process_chunker = None
+
+def chunk_document_in_process(content: str) -> List[Chunk]:
+    """
+    供进程池调用的分块入口，分词与切分在子进程中执行，不占用主进程的GIL。
+    每个子进程只创建一次分块器。
+    """
+    global _process_chunker
+    if _process_chunker is None:
+        _process_chunker = DocumentChunker()
+    return _process_chunker.chunk_document(content)
\ No newline at end of file
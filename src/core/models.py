@@ -0,0 +1,32 @@
+"""
+分块与翻译结果的数据结构
+使用 @dataclass(slots=True)，需要 Python 3.10 及以上（见 README 的环境要求）。
+"""
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional
+
+@dataclass(slots=True)
+class Chunk:
+    """文档块"""
+    content: str
+    tokens: int
+    chunk_id: int
+    type: str = 'chunk'  # 'complete'（整篇文档无需分块） | 'chunk'
+
+@dataclass(slots=True)
+class TranslationResult:
+    """单个块的翻译结果"""
+    original_content: str
+    translated_content: str
+    target_language: str
+    chunk_id: int  # 原始块ID，用于恢复原文顺序
+    input_tokens: int = 0
+    output_tokens: int = 0
+    processing_time: float = 0
+    success: bool = True
+    error: Optional[str] = None
+    cached: bool = False  # 命中翻译缓存，未调用模型
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典，便于序列化"""
+        return asdict(self)
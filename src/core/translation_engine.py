@@ -1,16 +1,31 @@
 """
 翻译引擎核心模块
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Optional, Tuple
+from functools import lru_cache
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from config import config
+from config import config, get_group_prompt
 from utils.tokenizer import token_calculator
 from utils.logger import get_logger
+from .models import Chunk, TranslationResult
+import logging
+import re
 import time
 import asyncio
 import concurrent.futures
-from threading import Semaphore
+import itertools
+import httpx
+
+
+# 组批量翻译时用于包裹和解析各块的标记
+_BATCH_CHUNK_RE = re.compile(r"<<<CHUNK (\d+)>>>(.*?)<<<END \1>>>", re.S)
+
+@lru_cache(maxsize=32)
+def _format_terminology(terminology_items: Tuple[Tuple[str, str], ...]) -> str:
+    """按术语条目拼接术语说明，结果按条目缓存"""
+    terminology_lines = [f"- {term}: {translation}" for term, translation in terminology_items]
+    return f"\n术语词典：\n" + "\n".join(terminology_lines) + "\n"
 
 class TranslationEngine:
     """
@@ -23,7 +38,6 @@ class TranslationEngine:
         初始化翻译引擎。
         - 设置LLM客户端，包括模型、API密钥和超时。
         - 初始化token计算器和日志记录器。
-        - 创建一个信号量来限制并行翻译的组数，防止API过载。
         """
         self.llm = ChatOpenAI(
             model=config.DEFAULT_MODEL,
@@ -31,30 +45,40 @@ class TranslationEngine:
             base_url=config.OPENAI_BASE_URL,
             temperature=0.3,
             request_timeout=120,  # 为LLM请求设置120秒超时，防止线程挂起
-            extra_body=dict(chat_template_kwargs=dict(enable_thinking=False))  # 禁用思考模式
+            extra_body=dict(chat_template_kwargs=dict(enable_thinking=False)),  # 禁用思考模式
+            # 异步调用共享同一个连接池，保持足够的长连接以支撑并发的块请求
+            http_async_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=config.MAX_PARALLEL_CHUNKS,
+                    max_keepalive_connections=config.MAX_PARALLEL_CHUNKS
+                ),
+                timeout=120
+            )
         )
         self.token_calculator = token_calculator  # 用于计算token数量
         self.logger = get_logger()  # 获取全局日志实例
-        # 创建信号量，其计数由配置文件中的MAX_PARALLEL_GROUPS决定，用于控制并发线程数
-        self.parallel_semaphore = Semaphore(config.MAX_PARALLEL_GROUPS)
     
     def translate_group(
         self, 
-        chunk_group: List[Dict[str, Any]],
+        chunk_group: List[Chunk],
         target_language: str,
-        terminology: Dict[str, str] = None
-    ) -> List[Dict[str, Any]]:
+        terminology: Dict[str, str] = None,
+        system_prompt: str = None
+    ) -> List[TranslationResult]:
         """
         翻译一组文档块。
-        此方法在组内是“串行”的，即按顺序逐个翻译块，以确保翻译的连贯性。
+        开启GROUP_BATCH_TRANSLATION时，组内多个块合并为一次请求翻译；
+        否则（或批量结果无法解析时）在组内“串行”地按顺序逐个翻译块，以确保翻译的连贯性。
         
         Args:
-            chunk_group (List[Dict[str, Any]]): 一个包含多个文档块（chunk）的列表。
+            chunk_group (List[Chunk]): 一个包含多个文档块（chunk）的列表。
             target_language (str): 目标翻译语言。
             terminology (Dict[str, str], optional): 一个术语词典，用于保证特定术语的翻译准确性。
+            system_prompt (str, optional): 已格式化的系统提示。并行翻译时每个请求只格式化一次，
+                所有组共享同一前缀，便于服务端命中前缀缓存。
             
         Returns:
-            List[Dict[str, Any]]: 一个包含每个块翻译结果的列表。
+            List[TranslationResult]: 一个包含每个块翻译结果的列表。
         """
         # 使用日志记录器的step上下文管理器来跟踪此操作
         with self.logger.step("translate_group", f"翻译组内{len(chunk_group)}个块"):
@@ -63,54 +87,62 @@ class TranslationEngine:
             # 准备并记录关于此翻译组的元数据信息
             group_info = {
                 "group_size": len(chunk_group),
-                "group_tokens": sum(chunk.get('tokens', 0) for chunk in chunk_group),
+                "group_tokens": sum(chunk.tokens for chunk in chunk_group),
                 "target_language": target_language,
                 "has_terminology": bool(terminology)
             }
             
             self.logger.info("开始组翻译", group_info)
             
-            # 将术语词典格式化为字符串，以便注入到系统提示中
-            terminology_info = self._build_terminology_info(terminology)
+            # 未传入系统提示时（单独调用本方法），在此格式化
+            if system_prompt is None:
+                system_prompt = self._build_system_prompt(target_language, terminology)
+            system_message = self._build_system_message(system_prompt)
             
-            # 从配置中获取系统提示模板，并填入目标语言和术语信息
-            system_prompt = config.SYSTEM_PROMPTS["translation"].format(
-                target_language=target_language,
-                terminology_info=terminology_info
-            )
+            # 多个块时先尝试合并为一次请求，失败则退回逐块翻译
+            if config.GROUP_BATCH_TRANSLATION and len(chunk_group) > 1:
+                try:
+                    response = self.llm.invoke(self._build_batch_messages(system_message, chunk_group))
+                    batch_results = self._parse_batch_response(response, chunk_group, target_language, group_start_time)
+                except Exception as e:
+                    self.logger.error("组批量翻译失败，改为逐块翻译", e, {"group_size": len(chunk_group)})
+                    batch_results = None
+                if batch_results is not None:
+                    self.logger.info("组翻译完成", {
+                        "group_size": len(chunk_group),
+                        "processing_time": time.time() - group_start_time,
+                        "success": True,
+                        "batched": True
+                    })
+                    return batch_results
             
             results = []  # 用于存储此组内每个块的翻译结果
+            debug_enabled = self.logger.is_enabled_for(logging.DEBUG)
             
             try:
                 # 遍历组内的每一个文档块，进行独立的翻译
                 for i, chunk in enumerate(chunk_group):
-                    # 为每个块构建独立的LLM消息，包括系统提示和用户内容（即要翻译的文本）
+                    # 为每个块构建独立的LLM消息：静态的系统提示在前，变化的块内容在后，保证前缀一致
                     messages = [
-                        SystemMessage(content=system_prompt),
-                        HumanMessage(content=chunk['content'])
+                        system_message,
+                        HumanMessage(content=chunk.content)
                     ]
                     # 调用LLM进行翻译，这是一个阻塞操作
                     response = self.llm.invoke(messages)
                     translated_content = response.content.strip()  # 清理翻译结果中的多余空白
                     # 构建包含详细信息的翻译结果字典
-                    result = {
-                        "original_content": chunk['content'],
-                        "translated_content": translated_content,
-                        "target_language": target_language,
-                        "chunk_id": chunk['chunk_id'], # 保留原始的块ID，用于后续排序
-                        "input_tokens": chunk.get('tokens', 0),
-                        "output_tokens": self.token_calculator.count_tokens(translated_content),
-                        "processing_time": time.time() - group_start_time,
-                        "success": True,
-                        "error": None
-                    }
+                    result = self._build_success_result(
+                        chunk, translated_content, target_language, group_start_time,
+                        output_tokens=self._get_output_tokens(response)
+                    )
                     results.append(result)
                     # 记录调试信息，说明组内单个块的翻译已完成
-                    self.logger.debug(f"组内第{i+1}个chunk翻译完成", {
-                        "chunk_id": chunk['chunk_id'],
-                        "output_length": len(translated_content),
-                        "output_tokens": result["output_tokens"]
-                    })
+                    if debug_enabled:
+                        self.logger.debug(f"组内第{i+1}个chunk翻译完成", {
+                            "chunk_id": chunk.chunk_id,
+                            "output_length": len(translated_content),
+                            "output_tokens": result.output_tokens
+                        })
                 
                 # 记录整个组翻译完成的信息
                 processing_time = time.time() - group_start_time
@@ -133,41 +165,29 @@ class TranslationEngine:
                 
                 # 为组内所有未成功处理的块创建失败结果
                 for i in range(len(results), len(chunk_group)):
-                    chunk = chunk_group[i]
-                    result = {
-                        "original_content": chunk['content'],
-                        "translated_content": "",
-                        "target_language": target_language,
-                        "chunk_id": chunk['chunk_id'],
-                        "input_tokens": 0,
-                        "output_tokens": 0,
-                        "processing_time": processing_time,
-                        "success": False,
-                        "error": str(e)
-                    }
-                    results.append(result)
+                    results.append(self._build_failed_result(chunk_group[i], target_language, e, processing_time))
                 
                 return results
     
     def parallel_group_translate(
         self,
-        chunk_groups: List[List[Dict[str, Any]]],
+        chunk_groups: List[List[Chunk]],
         target_language: str,
         terminology: Dict[str, str] = None,
         progress_callback: callable = None
-    ) -> List[Dict[str, Any]]:
+    ) -> List[TranslationResult]:
         """
         并行翻译多个文档块组。
         这是翻译引擎的核心性能所在，它使用线程池来同时处理多个翻译组。
         
         Args:
-            chunk_groups (List[List[Dict[str, Any]]]): 一个包含多个组的列表，每个组又包含多个块。
+            chunk_groups (List[List[Chunk]]): 一个包含多个组的列表，每个组又包含多个块。
             target_language (str): 目标翻译语言。
             terminology (Dict[str, str], optional): 术语词典。
             progress_callback (callable, optional): 一个回调函数，用于在翻译过程中报告进度。
             
         Returns:
-            List[Dict[str, Any]]: 一个包含所有块翻译结果的扁平化列表。
+            List[TranslationResult]: 一个包含所有块翻译结果的扁平化列表。
         """
         with self.logger.step("parallel_group_translate", f"并行翻译{len(chunk_groups)}个组"):
             batch_start_time = time.time()
@@ -184,36 +204,27 @@ class TranslationEngine:
             
             self.logger.info("开始并行组翻译", batch_info)
             
-            all_results = []
+            # 预先计算每组结果在扁平列表中的起始位置，完成的组直接写入对应区间
+            group_offsets = list(itertools.accumulate((len(group) for group in chunk_groups), initial=0))
+            all_results = [None] * group_offsets[-1]
             completed_groups = 0
             
+            # 系统提示每个请求只格式化一次，所有组共享同一前缀
+            system_prompt = self._build_system_prompt(target_language, terminology)
+            
             def translate_single_group(group_index, group):
                 """这是一个包装函数，用于在单独的线程中翻译单个组。"""
-                # 在进入翻译逻辑前，首先获取信号量。如果达到最大并发数，线程将在此处阻塞。
-                with self.parallel_semaphore:
-                    try:
-                        # 调用组翻译方法
-                        group_results = self.translate_group(group, target_language, terminology)
-                        return group_index, group_results
-                    except Exception as e:
-                        # 如果在组翻译过程中发生未捕获的异常，记录错误并返回失败结果
-                        self.logger.error(f"组{group_index}翻译失败", e)
-                        failed_results = []
-                        for chunk in group:
-                            failed_results.append({
-                                "original_content": chunk['content'],
-                                "translated_content": "",
-                                "target_language": target_language,
-                                "chunk_id": chunk['chunk_id'],
-                                "input_tokens": 0,
-                                "output_tokens": 0,
-                                "processing_time": 0,
-                                "success": False,
-                                "error": str(e)
-                            })
-                        return group_index, failed_results
+                try:
+                    # 调用组翻译方法
+                    group_results = self.translate_group(group, target_language, terminology, system_prompt)
+                    return group_index, group_results
+                except Exception as e:
+                    # 如果在组翻译过程中发生未捕获的异常，记录错误并返回失败结果
+                    self.logger.error(f"组{group_index}翻译失败", e)
+                    failed_results = [self._build_failed_result(chunk, target_language, e) for chunk in group]
+                    return group_index, failed_results
             
-            # 使用ThreadPoolExecutor来管理并发执行的线程
+            # 使用ThreadPoolExecutor来管理并发执行的线程，线程池大小即为并发上限
             with concurrent.futures.ThreadPoolExecutor(max_workers=config.MAX_PARALLEL_GROUPS) as executor:
                 # 提交所有组的翻译任务
                 future_to_group = {
@@ -221,21 +232,19 @@ class TranslationEngine:
                     for i, group in enumerate(chunk_groups)
                 }
                 
-                # 创建一个列表来按原始顺序存储每个组的结果
-                group_results = [None] * len(chunk_groups)
-                
                 # 使用as_completed来处理完成的任务，哪个任务先完成就先处理哪个
                 for future in concurrent.futures.as_completed(future_to_group):
                     group_index = future_to_group[future]
                     try:
                         # 获取任务的返回结果
                         result_group_index, results = future.result()
-                        # 将结果存放到对应索引的位置，确保最终顺序正确
-                        group_results[result_group_index] = results
+                        # 将结果写入该组对应的区间，确保最终顺序正确
+                        all_results[group_offsets[result_group_index]:group_offsets[result_group_index + 1]] = results
                         completed_groups += 1
                         
                         # 添加调试日志，记录每个组的详细翻译结果
-                        self.logger.debug(f"组 {result_group_index} 的翻译结果", {"result_data": results})
+                        if self.logger.is_enabled_for(logging.DEBUG):
+                            self.logger.debug(f"组 {result_group_index} 的翻译结果", {"result_data": [result.to_dict() for result in results]})
                         
                         # 如果提供了进度回调函数，则调用它来更新UI或外部状态
                         if progress_callback:
@@ -252,14 +261,13 @@ class TranslationEngine:
                     except Exception as e:
                         self.logger.error(f"处理组{group_index}结果时出错", e)
             
-            # 按顺序合并所有组的结果到一个扁平列表中
-            for group_result in group_results:
-                if group_result:
-                    all_results.extend(group_result)
+            # 处理结果出错的组留下的空位
+            if None in all_results:
+                all_results = [result for result in all_results if result is not None]
             
             # 记录整个并行翻译任务完成后的最终统计数据
             processing_time = time.time() - batch_start_time
-            successful_translations = sum(1 for result in all_results if result.get('success', False))
+            successful_translations = sum(1 for result in all_results if result.success)
             
             final_stats = {
                 "total_groups": len(chunk_groups),
@@ -274,6 +282,267 @@ class TranslationEngine:
             
             return all_results
     
+    async def _translate_chunk_async(
+        self,
+        chunk: Chunk,
+        target_language: str,
+        system_message: SystemMessage,
+        semaphore: asyncio.Semaphore,
+        start_time: float
+    ) -> TranslationResult:
+        """
+        异步翻译单个块，由信号量限制同时进行的请求数。
+        块之间互不依赖，失败时只影响当前块。
+        """
+        messages = [
+            system_message,
+            HumanMessage(content=chunk.content)
+        ]
+        try:
+            async with semaphore:
+                response = await self.llm.ainvoke(messages)
+            return self._build_success_result(
+                chunk, response.content.strip(), target_language, start_time,
+                output_tokens=self._get_output_tokens(response)
+            )
+        except Exception as e:
+            self.logger.error("块翻译失败", e, {"chunk_id": chunk.chunk_id})
+            return self._build_failed_result(chunk, target_language, e, time.time() - start_time)
+    
+    async def translate_group_async(
+        self,
+        chunk_group: List[Chunk],
+        target_language: str,
+        terminology: Dict[str, str] = None,
+        system_prompt: str = None,
+        semaphore: asyncio.Semaphore = None
+    ) -> List[TranslationResult]:
+        """
+        translate_group 的异步版本，使用 llm.ainvoke 发起请求，不占用线程。
+        组内多个块优先合并为一次请求，无法解析时退回各块并发翻译，结果顺序与输入一致。
+        
+        Args:
+            chunk_group (List[Chunk]): 一个包含多个文档块（chunk）的列表。
+            target_language (str): 目标翻译语言。
+            terminology (Dict[str, str], optional): 术语词典。
+            system_prompt (str, optional): 已格式化的系统提示。
+            semaphore (asyncio.Semaphore, optional): 限制并发块请求数的信号量，多个组共享时由调用方传入。
+            
+        Returns:
+            List[TranslationResult]: 一个包含每个块翻译结果的列表。
+        """
+        group_start_time = time.time()
+        if system_prompt is None:
+            system_prompt = self._build_system_prompt(target_language, terminology)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(config.MAX_PARALLEL_CHUNKS)
+        system_message = self._build_system_message(system_prompt)
+        
+        results = None
+        if config.GROUP_BATCH_TRANSLATION and len(chunk_group) > 1:
+            try:
+                async with semaphore:
+                    response = await self.llm.ainvoke(self._build_batch_messages(system_message, chunk_group))
+                results = self._parse_batch_response(response, chunk_group, target_language, group_start_time)
+            except Exception as e:
+                self.logger.error("组批量翻译失败，改为逐块翻译", e, {"group_size": len(chunk_group)})
+        
+        if results is None:
+            results = await asyncio.gather(*[
+                self._translate_chunk_async(chunk, target_language, system_message, semaphore, group_start_time)
+                for chunk in chunk_group
+            ])
+        
+        self.logger.info("组翻译完成", {
+            "group_size": len(chunk_group),
+            "processing_time": time.time() - group_start_time,
+            "success": all(result.success for result in results)
+        })
+        
+        return results
+    
+    async def parallel_group_translate_async(
+        self,
+        chunk_groups: List[List[Chunk]],
+        target_language: str,
+        terminology: Dict[str, str] = None,
+        progress_callback: callable = None
+    ) -> List[TranslationResult]:
+        """
+        parallel_group_translate 的异步版本。
+        所有块在同一个事件循环中并发执行，由 asyncio.Semaphore 限制同时进行的块请求数；
+        组仅用于进度回报。
+        
+        Args:
+            chunk_groups (List[List[Chunk]]): 一个包含多个组的列表，每个组又包含多个块。
+            target_language (str): 目标翻译语言。
+            terminology (Dict[str, str], optional): 术语词典。
+            progress_callback (callable, optional): 一个回调函数，用于在翻译过程中报告进度。
+            
+        Returns:
+            List[TranslationResult]: 一个包含所有块翻译结果的扁平化列表，顺序与输入一致。
+        """
+        batch_start_time = time.time()
+        self.logger.info("开始异步并行组翻译", {
+            "total_groups": len(chunk_groups),
+            "total_chunks": sum(len(group) for group in chunk_groups),
+            "target_language": target_language,
+            "max_parallel_chunks": config.MAX_PARALLEL_CHUNKS,
+            "has_terminology": bool(terminology)
+        })
+        
+        system_prompt = self._build_system_prompt(target_language, terminology)
+        semaphore = asyncio.Semaphore(config.MAX_PARALLEL_CHUNKS)
+        completed_groups = 0
+        
+        async def translate_single_group(group):
+            nonlocal completed_groups
+            results = await self.translate_group_async(group, target_language, terminology, system_prompt, semaphore)
+            completed_groups += 1
+            if progress_callback:
+                progress_callback(completed_groups, len(chunk_groups), results)
+            return results
+        
+        # gather按提交顺序返回结果，无需再排序
+        group_results = await asyncio.gather(*[translate_single_group(group) for group in chunk_groups])
+        all_results = [result for results in group_results for result in results]
+        
+        processing_time = time.time() - batch_start_time
+        successful_translations = sum(1 for result in all_results if result.success)
+        self.logger.info("异步并行组翻译完成", {
+            "total_groups": len(chunk_groups),
+            "total_chunks": len(all_results),
+            "successful_translations": successful_translations,
+            "failed_translations": len(all_results) - successful_translations,
+            "total_processing_time": processing_time
+        })
+        
+        return all_results
+    
+    def _build_success_result(
+        self,
+        chunk: Chunk,
+        translated_content: str,
+        target_language: str,
+        start_time: float,
+        output_tokens: Optional[int] = None
+    ) -> TranslationResult:
+        """构建单个块翻译成功的结果，未提供输出token数时才在本地计算"""
+        if output_tokens is None:
+            output_tokens = self.token_calculator.count_tokens(translated_content)
+        return TranslationResult(
+            original_content=chunk.content,
+            translated_content=translated_content,
+            target_language=target_language,
+            chunk_id=chunk.chunk_id,  # 保留原始的块ID，用于后续排序
+            input_tokens=chunk.tokens,
+            output_tokens=output_tokens,
+            processing_time=time.time() - start_time
+        )
+    
+    def _build_batch_messages(self, system_message: SystemMessage, chunk_group: List[Chunk]) -> list:
+        """
+        将组内所有块用 <<<CHUNK n>>> ... <<<END n>>> 标记包裹后合并为一条用户消息。
+        标记说明放在用户消息开头，系统提示保持不变，与逐块翻译共享同一前缀。
+        """
+        parts = [config.SYSTEM_PROMPTS["batch_instruction"].format(chunk_count=len(chunk_group))]
+        for i, chunk in enumerate(chunk_group):
+            parts.append(f"<<<CHUNK {i}>>>\n{chunk.content}\n<<<END {i}>>>\n\n")
+        return [system_message, HumanMessage(content="".join(parts))]
+    
+    def _parse_batch_response(
+        self,
+        response,
+        chunk_group: List[Chunk],
+        target_language: str,
+        start_time: float
+    ) -> Optional[List[TranslationResult]]:
+        """
+        按标记拆分批量翻译的响应并映射回各块。
+        标记缺失、重复或为空时返回None，由调用方退回逐块翻译。
+        """
+        translations = {}
+        for match in _BATCH_CHUNK_RE.finditer(response.content):
+            index = int(match.group(1))
+            if index in translations:
+                return None
+            translations[index] = match.group(2).strip()
+        if len(translations) != len(chunk_group) or not all(translations.get(i) for i in range(len(chunk_group))):
+            self.logger.error("组批量翻译结果无法解析，改为逐块翻译", extra_data={
+                "group_size": len(chunk_group),
+                "parsed_chunks": len(translations)
+            })
+            return None
+        
+        # 接口只返回整次请求的输出token数，按译文长度分摊到各块
+        total_output_tokens = self._get_output_tokens(response)
+        total_length = sum(len(text) for text in translations.values())
+        results = []
+        for i, chunk in enumerate(chunk_group):
+            translated_content = translations[i]
+            output_tokens = None
+            if total_output_tokens is not None:
+                output_tokens = round(total_output_tokens * len(translated_content) / total_length)
+            results.append(self._build_success_result(
+                chunk, translated_content, target_language, start_time, output_tokens=output_tokens
+            ))
+        return results
+    
+    def _get_output_tokens(self, response) -> Optional[int]:
+        """
+        从模型响应中读取接口返回的输出token数，避免再对译文做一次分词。
+        响应中没有用量信息时返回None。
+        """
+        usage = getattr(response, 'usage_metadata', None) or {}
+        if usage.get('output_tokens'):
+            return usage['output_tokens']
+        token_usage = (getattr(response, 'response_metadata', None) or {}).get('token_usage') or {}
+        return token_usage.get('completion_tokens')
+    
+    def _build_failed_result(
+        self,
+        chunk: Chunk,
+        target_language: str,
+        error: Exception,
+        processing_time: float = 0
+    ) -> TranslationResult:
+        """构建单个块翻译失败的结果"""
+        return TranslationResult(
+            original_content=chunk.content,
+            translated_content="",
+            target_language=target_language,
+            chunk_id=chunk.chunk_id,
+            processing_time=processing_time,
+            success=False,
+            error=str(error)
+        )
+    
+    def _build_system_prompt(self, target_language: str, terminology: Dict[str, str] = None) -> str:
+        """
+        根据目标语言和术语词典格式化组翻译的系统提示。
+        
+        Args:
+            target_language (str): 目标翻译语言。
+            terminology (Dict[str, str], optional): 术语词典。
+            
+        Returns:
+            str: 格式化后的系统提示。
+        """
+        return get_group_prompt(target_language, self._build_terminology_info(terminology))
+    
+    def _build_system_message(self, system_prompt: str) -> SystemMessage:
+        """
+        构建系统消息。开启PROMPT_CACHE_CONTROL时为其添加cache_control标记，
+        以便需要显式标记的服务端缓存这段静态前缀。
+        """
+        if not config.PROMPT_CACHE_CONTROL:
+            return SystemMessage(content=system_prompt)
+        return SystemMessage(content=[{
+            "type": "text",
+            "text": system_prompt,
+            "cache_control": {"type": "ephemeral"}
+        }])
+    
     def _build_terminology_info(self, terminology: Dict[str, str] = None) -> str:
         """
         将术语词典构造成一个格式化的字符串，以便嵌入到系统提示中。
@@ -286,10 +555,7 @@ class TranslationEngine:
         """
         if not terminology:
             return ""
-        
-        terminology_lines = []
-        for term, translation in terminology.items():
-            terminology_lines.append(f"- {term}: {translation}")
-        
-        return f"\n术语词典：\n" + "\n".join(terminology_lines) + "\n"
+        # 同一份术语词典在多组、多次请求间只拼接一次
+        return _format_terminology(tuple(terminology.items()))
+
     
\ No newline at end of file
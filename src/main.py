@@ -2,8 +2,11 @@
 FastAPI 应用主入口
 提供HTTP API接口用于翻译服务
 """
+import asyncio
+from typing import Optional
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request as FastAPIRequest
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Request as FastAPIRequest
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from api.models import (
     TranslationRequest, 
     TranslationResponse, 
@@ -13,40 +16,130 @@ from api.models import (
 )
 from api.services import TranslationService
 from api.task_manager import TaskManager
-from utils.logger import init_logger
+from config import config
+from utils.logger import get_logger, init_logger
 
 # 初始化
-init_logger(debug_mode=True)
 app = FastAPI(
     title="文档翻译 Agent API",
     description="提供异步翻译任务处理的API服务。",
-    version="1.0.0"
+    version="1.0.0",
+    # 译文可能很大，使用orjson在C层完成序列化，减少事件循环的阻塞时间
+    default_response_class=ORJSONResponse
 )
-translation_service = TranslationService()
-task_manager = TaskManager()
+# 日志、翻译服务和任务管理器在启动事件中创建：进程池以spawn方式启动的子进程会重新导入入口模块，
+# 放在模块顶层会让每个子进程都重复创建翻译服务、打开任务数据库
+translation_service: Optional[TranslationService] = None
+task_manager: Optional[TaskManager] = None
 
-def run_translation_task(task_id: str, request_data: TranslationRequest):
+@app.on_event("startup")
+async def init_services():
+    """
+    创建日志、翻译服务和任务管理器。
+    """
+    global translation_service, task_manager
+    init_logger(
+        log_dir=config.LOG_DIR,
+        debug_mode=config.DEBUG_MODE,
+        pretty_json=config.LOG_PRETTY_JSON,
+        log_level=config.LOG_LEVEL
+    )
+    translation_service = TranslationService()
+    task_manager = TaskManager()
+
+@app.on_event("shutdown")
+async def close_services():
+    """
+    关闭翻译服务持有的进程池。
+    """
+    if translation_service is not None:
+        translation_service.close()
+
+# 由本模块创建的后台asyncio任务；事件循环只保存任务的弱引用，需在此持有直到任务结束，避免被中途回收
+_background_tasks = set()
+
+def spawn_background_task(coro) -> asyncio.Task:
+    """创建后台任务并保留引用，任务结束后自动移除"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def get_task_manager() -> TaskManager:
+    """
+    任务管理器依赖，测试时可通过 app.dependency_overrides 替换。
+    """
+    return task_manager
+
+async def run_translation_task(task_manager: TaskManager, task_id: str, request_data: TranslationRequest):
     """
     后台执行的翻译任务函数。
+    翻译请求以异步方式并发发出，不占用线程池中的线程。
+    task_manager 由调用方传入，与创建任务时使用的是同一个任务存储。
+    SQLite读写（含序列化整篇译文）可能因等待数据库锁而阻塞，均放到线程中执行，避免卡住事件循环。
     """
+    heartbeat = spawn_background_task(renew_task_lease(task_manager, task_id))
+    translation = None
     try:
-        task_manager.set_status(task_id, "running")
-        result = translation_service.translate_document(
+        await asyncio.to_thread(task_manager.set_status, task_id, "running")
+        translation = asyncio.ensure_future(translation_service.translate_document_async(
             content=request_data.content,
             target_language=request_data.target_language,
             terminology=request_data.terminology
-        )
-        task_manager.set_result(task_id, result)
+        ))
+        # 续期协程只在租约丢失时结束，此时任务已由其他worker接管，放弃本次翻译
+        await asyncio.wait((translation, heartbeat), return_when=asyncio.FIRST_COMPLETED)
+        if not translation.done():
+            get_logger().info(f"任务 {task_id} 的租约已被其他worker接管，停止执行")
+            return
+        await asyncio.to_thread(task_manager.set_result, task_id, translation.result())
     except Exception as e:
-        app.logger.error(f"任务 {task_id} 执行失败: {e}", exc_info=True)
-        task_manager.set_error(task_id, str(e))
+        get_logger().error(f"任务 {task_id} 执行失败: {e}", e)
+        try:
+            await asyncio.to_thread(task_manager.set_error, task_id, str(e))
+        except KeyError:
+            # 任务已过期或已被其他worker接管，由新的持有者负责写入状态
+            pass
+    finally:
+        heartbeat.cancel()
+        if translation is not None and not translation.done():
+            translation.cancel()
+
+async def renew_task_lease(task_manager: TaskManager, task_id: str):
+    """
+    任务执行期间定期续期租约，表明当前worker仍在执行该任务，其他worker启动时不会重复执行。
+    续期失败说明租约已过期并被其他worker接管，此时协程结束，由 run_translation_task 停止翻译。
+    """
+    while True:
+        await asyncio.sleep(task_manager.lease_seconds / 3)
+        if not await asyncio.to_thread(task_manager.renew_lease, task_id):
+            return
+
+@app.on_event("startup")
+async def resume_unfinished_tasks():
+    """
+    启动时恢复上次未完成的任务（需开启TASK_RESUME_ON_STARTUP）。
+    只恢复租约已过期（原worker已退出）的任务，且每个任务只会被一个worker接管。
+    """
+    if not config.TASK_RESUME_ON_STARTUP:
+        return
+    # 启动事件中无法使用依赖注入，按与路由相同的方式解析（包括 dependency_overrides）
+    task_manager = app.dependency_overrides.get(get_task_manager, get_task_manager)()
+    for task_id in await asyncio.to_thread(task_manager.get_unfinished_tasks):
+        # 先原子地接管任务，接管失败说明已有其他worker在执行
+        if not await asyncio.to_thread(task_manager.claim_task, task_id):
+            continue
+        task = await asyncio.to_thread(task_manager.get_task, task_id)
+        request_data = TranslationRequest(**task["request_data"])
+        spawn_background_task(run_translation_task(task_manager, task_id, request_data))
 
 @app.post("/translation/start", 
             response_model=TaskCreationResponse,
             status_code=202,
             summary="启动一个异步翻译任务",
             description="提交翻译请求，服务将在后台处理，并立即返回一个任务ID。")
-async def start_translation(request: TranslationRequest, background_tasks: BackgroundTasks, http_request: FastAPIRequest):
+async def start_translation(request: TranslationRequest, background_tasks: BackgroundTasks, http_request: FastAPIRequest,
+                            task_manager: TaskManager = Depends(get_task_manager)):
     """
     接收翻译请求，创建后台任务，并立即返回任务ID。
     """
@@ -56,10 +149,10 @@ async def start_translation(request: TranslationRequest, background_tasks: Backg
         "target_language": request.target_language,
         "terminology": request.terminology
     }
-    task_id = task_manager.create_task(request_data)
+    task_id = await asyncio.to_thread(task_manager.create_task, request_data)
     
     # 将耗时的翻译任务添加到后台执行
-    background_tasks.add_task(run_translation_task, task_id, request)
+    background_tasks.add_task(run_translation_task, task_manager, task_id, request)
     
     # 构建状态和结果查询的URL
     status_url = http_request.url_for('get_task_status', task_id=task_id)
@@ -71,15 +164,31 @@ async def start_translation(request: TranslationRequest, background_tasks: Backg
         result_url=str(result_url)
     )
 
+@app.post("/translation/stream",
+            summary="流式翻译",
+            description="同步处理翻译请求，译文按原文顺序分段流式返回。")
+async def stream_translation(request: TranslationRequest):
+    """
+    流式返回翻译结果，首段译文在对应的块翻译完成后即可到达客户端。
+    """
+    return StreamingResponse(
+        translation_service.translate_document_stream(
+            content=request.content,
+            target_language=request.target_language,
+            terminology=request.terminology
+        ),
+        media_type="text/plain"
+    )
+
 @app.get("/translation/status/{task_id}", 
            response_model=TaskStatusResponse,
            summary="查询翻译任务的状态",
            description="根据任务ID查询翻译任务的当前状态。")
-async def get_task_status(task_id: str):
+async def get_task_status(task_id: str, task_manager: TaskManager = Depends(get_task_manager)):
     """
     根据任务ID返回任务的当前状态。
     """
-    task = task_manager.get_task(task_id)
+    task = await asyncio.to_thread(task_manager.get_task, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务未找到")
     
@@ -94,11 +203,11 @@ async def get_task_status(task_id: str):
            summary="获取翻译任务的结果",
            description="根据任务ID获取翻译结果。只有在任务完成后才能获取。",
            responses={202: {"description": "任务仍在处理中"}, 404: {"model": ErrorResponse}})
-async def get_task_result(task_id: str):
+async def get_task_result(task_id: str, task_manager: TaskManager = Depends(get_task_manager)):
     """
     根据任务ID返回翻译结果。
     """
-    task = task_manager.get_task(task_id)
+    task = await asyncio.to_thread(task_manager.get_task, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务未找到")
     
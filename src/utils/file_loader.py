@@ -1,13 +1,56 @@
 """
 文件加载工具
 """
+import atexit
 import os
-from typing import Optional
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterator, Optional
 from pathlib import Path
+import pymupdf  # PyMuPDF
 import PyPDF2
 import docx2txt
 from markdownify import markdownify as md
 from config import config
+from .html_converter import html_to_markdown
+from .logger import process_pool_options
+
+@lru_cache(maxsize=16)
+def _load_cached(file_path: str, suffix: str, mtime_ns: int, size: int) -> str:
+    """按后缀解析文件内容；mtime_ns与size只参与缓存键，文件被修改后自动失效"""
+    handler = _HANDLERS.get(suffix)
+    if handler is None:
+        raise ValueError(f"未实现的文件格式处理: {suffix}")
+    return handler(file_path)
+
+# PDF提取用的进程池，首次需要时创建并在整个进程生命周期内复用，避免每次加载都启动子进程
+_pdf_process_pool = None
+_pdf_process_pool_lock = threading.Lock()
+
+def _get_pdf_process_pool() -> ProcessPoolExecutor:
+    """获取（必要时创建）PDF提取进程池"""
+    global _pdf_process_pool
+    with _pdf_process_pool_lock:
+        if _pdf_process_pool is None:
+            _pdf_process_pool = ProcessPoolExecutor(
+                max_workers=config.PDF_PROCESS_WORKERS, **process_pool_options()
+            )
+            atexit.register(shutdown_pdf_process_pool)
+        return _pdf_process_pool
+
+def shutdown_pdf_process_pool():
+    """关闭PDF提取进程池（进程退出时自动调用）"""
+    global _pdf_process_pool
+    with _pdf_process_pool_lock:
+        if _pdf_process_pool is not None:
+            _pdf_process_pool.shutdown()
+            _pdf_process_pool = None
+
+def _extract_pdf_pages(file_path: str, start: int, stop: int) -> str:
+    """在子进程中打开PDF并提取[start, stop)页的文本"""
+    with pymupdf.open(file_path) as doc:
+        return "\n".join(doc[page_no].get_text("text") for page_no in range(start, stop))
 
 class FileLoader:
     """文件加载器"""
@@ -15,50 +58,95 @@ class FileLoader:
     @staticmethod
     def load_file(file_path: str) -> str:
         """加载文件内容"""
-        path = Path(file_path)
-        
-        if not path.exists():
-            raise FileNotFoundError(f"文件不存在: {file_path}")
+        # 只stat一次：既判断文件是否存在，又取得缓存键所需的修改时间和大小
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"文件不存在: {file_path}") from None
         
-        suffix = path.suffix.lower()
+        suffix = os.path.splitext(file_path)[1].lower()
         
         if suffix not in config.SUPPORTED_FORMATS:
             raise ValueError(f"不支持的文件格式: {suffix}")
         
-        if suffix == ".md":
-            return FileLoader._load_markdown(file_path)
-        elif suffix == ".txt":
-            return FileLoader._load_text(file_path)
-        elif suffix == ".pdf":
-            return FileLoader._load_pdf(file_path)
-        elif suffix == ".docx":
-            return FileLoader._load_docx(file_path)
-        elif suffix == ".html":
-            return FileLoader._load_html(file_path)
-        else:
-            raise ValueError(f"未实现的文件格式处理: {suffix}")
+        # 以(路径, 修改时间, 大小)为键缓存解析结果，文件未变化时重复加载无需再次解析PDF/Word
+        return _load_cached(os.fspath(file_path), suffix, stat.st_mtime_ns, stat.st_size)
     
     @staticmethod
     def _load_markdown(file_path: str) -> str:
         """加载Markdown文件"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        # 一次读出全部字节再整体解码，避免TextIOWrapper分块增量解码的开销
+        return Path(file_path).read_bytes().decode('utf-8')
     
     @staticmethod
     def _load_text(file_path: str) -> str:
         """加载文本文件"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        # 一次读出全部字节再整体解码，避免TextIOWrapper分块增量解码的开销
+        return Path(file_path).read_bytes().decode('utf-8')
     
     @staticmethod
     def _load_pdf(file_path: str) -> str:
-        """加载PDF文件"""
-        content = ""
-        with open(file_path, 'rb') as f:
+        """
+        加载PDF文件
+        优先使用基于C实现的PyMuPDF提取文本；PyMuPDF无法打开（如加密文件）时退回PyPDF2。
+        页数超过PDF_PARALLEL_MIN_PAGES时使用多进程并行提取。
+        """
+        try:
+            doc = pymupdf.open(file_path)
+        except Exception:
+            return FileLoader._load_pdf_with_pypdf2(file_path)
+        with doc:
+            if doc.needs_pass:
+                return FileLoader._load_pdf_with_pypdf2(file_path)
+            page_count = doc.page_count
+            if config.PDF_PROCESS_WORKERS <= 1 or page_count <= config.PDF_PARALLEL_MIN_PAGES:
+                return "\n".join(FileLoader._iter_pymupdf_pages(doc))
+        
+        # 页数较多时按连续页段分给多个子进程并行提取，结果按页段顺序拼接
+        workers = min(config.PDF_PROCESS_WORKERS, page_count)
+        step = -(-page_count // workers)
+        starts = range(0, page_count, step)
+        stops = [min(start + step, page_count) for start in starts]
+        pool = _get_pdf_process_pool()
+        return "\n".join(pool.map(_extract_pdf_pages, [file_path] * len(starts), starts, stops))
+    
+    @staticmethod
+    def iter_pages(file_path: str) -> Iterator[str]:
+        """
+        逐页产出PDF文本，不在内存中拼接整篇文档。
+        与_load_pdf相同，PyMuPDF无法打开时退回PyPDF2。
+        """
+        try:
+            doc = pymupdf.open(file_path)
+        except Exception:
+            yield from FileLoader._iter_pages_with_pypdf2(file_path)
+            return
+        with doc:
+            if doc.needs_pass:
+                yield from FileLoader._iter_pages_with_pypdf2(file_path)
+            else:
+                yield from FileLoader._iter_pymupdf_pages(doc)
+    
+    @staticmethod
+    def _iter_pymupdf_pages(doc) -> Iterator[str]:
+        """逐页提取已打开的PyMuPDF文档的文本"""
+        for page in doc.pages():
+            yield page.get_text("text")
+    
+    @staticmethod
+    def _iter_pages_with_pypdf2(file_path: str) -> Iterator[str]:
+        """使用PyPDF2逐页提取文本"""
+        # 较大的读缓冲减少PyPDF2随机小块读取时的系统调用
+        with open(file_path, 'rb', buffering=1 << 20) as f:
             pdf_reader = PyPDF2.PdfReader(f)
             for page in pdf_reader.pages:
-                content += page.extract_text() + "\n"
-        return content
+                yield page.extract_text()
+    
+    @staticmethod
+    def _load_pdf_with_pypdf2(file_path: str) -> str:
+        """使用PyPDF2加载PDF文件"""
+        # 各页文本收集后一次拼接，避免反复复制
+        return "\n".join(FileLoader._iter_pages_with_pypdf2(file_path))
     
     @staticmethod
     def _load_docx(file_path: str) -> str:
@@ -67,10 +155,16 @@ class FileLoader:
     
     @staticmethod
     def _load_html(file_path: str) -> str:
-        """加载HTML文件并转换为Markdown"""
+        """
+        加载HTML文件并转换为Markdown
+        优先使用基于selectolax的转换器，转换失败时退回markdownify。
+        """
         with open(file_path, 'r', encoding='utf-8') as f:
             html_content = f.read()
-        return md(html_content)
+        try:
+            return html_to_markdown(html_content)
+        except Exception:
+            return md(html_content)
     
     @staticmethod
     def save_file(content: str, file_path: str) -> None:
@@ -78,16 +172,27 @@ class FileLoader:
         path = Path(file_path)
         path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        # 整体编码一次后以字节写入，避免文本模式逐块增量编码
+        data = content.encode('utf-8')
+        with open(file_path, 'wb', buffering=1 << 20) as f:
+            f.write(data)
     
     @staticmethod
     def get_file_info(file_path: str) -> dict:
         """获取文件信息"""
-        path = Path(file_path)
+        suffix = os.path.splitext(file_path)[1]
         return {
-            "name": path.name,
-            "size": path.stat().st_size,
-            "suffix": path.suffix,
-            "is_supported": path.suffix.lower() in config.SUPPORTED_FORMATS
-        } 
\ No newline at end of file
+            "name": os.path.basename(file_path),
+            "size": os.stat(file_path).st_size,
+            "suffix": suffix,
+            "is_supported": suffix.lower() in config.SUPPORTED_FORMATS
+        }
+
+# 文件后缀到加载函数的映射，新增格式只需在此登记
+_HANDLERS = {
+    ".md": FileLoader._load_markdown,
+    ".txt": FileLoader._load_text,
+    ".pdf": FileLoader._load_pdf,
+    ".docx": FileLoader._load_docx,
+    ".html": FileLoader._load_html,
+}
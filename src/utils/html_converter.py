@@ -0,0 +1,108 @@
+"""
+HTML转Markdown工具
+基于selectolax的lexbor后端（C实现的HTML解析器）遍历节点树生成Markdown，比逐节点走BeautifulSoup树的markdownify快得多。
+"""
+import re
+from selectolax.lexbor import LexborHTMLParser as HTMLParser, LexborNode as Node
+
+# 内容不输出的标签
+_SKIP_TAGS = frozenset({"head", "script", "style", "noscript", "template", "-comment"})
+# 块级标签：内容前后各空一行
+_BLOCK_TAGS = frozenset({
+    "p", "div", "section", "article", "header", "footer", "main", "nav", "aside",
+    "figure", "figcaption", "table", "form", "dl", "dt", "dd",
+})
+_HEADING_LEVELS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+def html_to_markdown(html_content: str) -> str:
+    """将HTML文本转换为Markdown"""
+    tree = HTMLParser(html_content)
+    root = tree.body or tree.root
+    if root is None:
+        return ""
+    return _BLANK_LINES_RE.sub("\n\n", _render_children(root, 0)).strip()
+
+def _render_children(node: Node, list_depth: int) -> str:
+    """依次渲染子节点（包括文本节点）并拼接，去掉块级内容前后残留的空格"""
+    parts = []
+    for child in node.iter(include_text=True):
+        text = _render(child, list_depth)
+        if text.startswith("\n"):
+            if parts:
+                parts[-1] = parts[-1].rstrip(" ")
+        elif parts and parts[-1].endswith("\n"):
+            text = text.lstrip(" ")
+        if text:
+            parts.append(text)
+    return "".join(parts)
+
+def _render(node: Node, list_depth: int) -> str:
+    """渲染单个节点，list_depth为当前列表嵌套层数，用于缩进嵌套列表"""
+    tag = node.tag
+    if tag == "-text":
+        return _WHITESPACE_RE.sub(" ", node.text(deep=False))
+    if tag in _SKIP_TAGS:
+        return ""
+    if tag in _HEADING_LEVELS:
+        return f"\n\n{'#' * _HEADING_LEVELS[tag]} {_render_children(node, list_depth).strip()}\n\n"
+    if tag in _BLOCK_TAGS:
+        return f"\n\n{_render_children(node, list_depth).strip()}\n\n"
+    if tag == "br":
+        return "\n"
+    if tag == "hr":
+        return "\n\n---\n\n"
+    if tag in ("strong", "b"):
+        inner = _render_children(node, list_depth).strip()
+        return f"**{inner}**" if inner else ""
+    if tag in ("em", "i"):
+        inner = _render_children(node, list_depth).strip()
+        return f"*{inner}*" if inner else ""
+    if tag == "code":
+        return f"`{node.text(deep=True)}`"
+    if tag == "pre":
+        # 代码块保留原始空白
+        return f"\n\n```\n{node.text(deep=True).strip(chr(10))}\n```\n\n"
+    if tag == "a":
+        inner = _render_children(node, list_depth).strip()
+        href = node.attributes.get("href")
+        return f"[{inner}]({href})" if href else inner
+    if tag == "img":
+        return f"![{node.attributes.get('alt') or ''}]({node.attributes.get('src') or ''})"
+    if tag in ("ul", "ol"):
+        return _render_list(node, list_depth)
+    if tag == "blockquote":
+        inner = _BLANK_LINES_RE.sub("\n\n", _render_children(node, list_depth)).strip()
+        return "\n\n" + "\n".join(f"> {line}" if line else ">" for line in inner.split("\n")) + "\n\n"
+    if tag == "tr":
+        return _render_table_row(node, list_depth)
+    return _render_children(node, list_depth)
+
+def _render_list(node: Node, list_depth: int) -> str:
+    """渲染有序/无序列表，嵌套列表按层级缩进"""
+    ordered = node.tag == "ol"
+    indent = "    " * list_depth
+    lines = []
+    index = 1
+    for item in node.iter():
+        if item.tag != "li":
+            continue
+        marker = f"{index}." if ordered else "-"
+        content = _BLANK_LINES_RE.sub("\n", _render_children(item, list_depth + 1)).strip()
+        lines.append(f"{indent}{marker} {content}")
+        index += 1
+    body = "\n".join(lines)
+    # 嵌套列表紧跟在父列表项后面，不额外空行
+    return f"\n{body}\n" if list_depth else f"\n\n{body}\n\n"
+
+def _render_table_row(node: Node, list_depth: int) -> str:
+    """渲染表格行；由th组成的行视为表头，后面补一行分隔线"""
+    cells = [cell for cell in node.iter() if cell.tag in ("td", "th")]
+    if not cells:
+        return ""
+    row = "| " + " | ".join(_render_children(cell, list_depth).strip() for cell in cells) + " |"
+    if all(cell.tag == "th" for cell in cells):
+        row += "\n|" + " --- |" * len(cells)
+    return f"\n{row}"
@@ -1,6 +1,10 @@
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
 import os
-import json
+import queue
+import orjson
 import time
 from datetime import datetime
 from typing import Dict, Any, Optional, List
@@ -8,21 +12,82 @@ from pathlib import Path
 import threading
 from contextlib import contextmanager
 
+class BufferedFileHandler(logging.FileHandler):
+    """
+    带大缓冲区的文件处理器。
+    日志先写入1MB的缓冲区，每累计一定条数或间隔一定时间才真正刷到磁盘，减少小块写入的系统调用。
+    """
+    BUFFER_SIZE = 1 << 20
+    FLUSH_EVERY_RECORDS = 1000
+    FLUSH_INTERVAL = 2.0  # 秒
+
+    def __init__(self, filename, mode='a', encoding=None):
+        # delay=True：第一条日志写入前不打开文件
+        super().__init__(filename, mode=mode, encoding=encoding, delay=True)
+        self._pending_records = 0
+        self._last_flush = time.monotonic()
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.BUFFER_SIZE, encoding=self.encoding, errors=self.errors)
+
+    def flush(self):
+        """每条日志后都会被调用，只在达到条数或时间阈值时才真正刷盘"""
+        self._pending_records += 1
+        if (self._pending_records >= self.FLUSH_EVERY_RECORDS
+                or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL):
+            self.force_flush()
+
+    def force_flush(self):
+        """立即把缓冲区内容写入磁盘，可从任意线程调用"""
+        with self.lock:
+            super().flush()
+            self._pending_records = 0
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.stream:
+                self.force_flush()
+        finally:
+            self.release()
+        super().close()
+
+class _TimedFlushQueueListener(logging.handlers.QueueListener):
+    """
+    在队列空闲时刷新带缓冲的文件处理器。
+    最后一条日志之后若FLUSH_INTERVAL内没有新日志，缓冲区内容即写入磁盘，不会一直滞留到进程退出。
+    """
+    def dequeue(self, block):
+        try:
+            return self.queue.get(block, timeout=BufferedFileHandler.FLUSH_INTERVAL)
+        except queue.Empty:
+            for handler in self.handlers:
+                if isinstance(handler, BufferedFileHandler):
+                    handler.force_flush()
+            return self.queue.get(block)
+
 class TranslationLogger:
     """翻译过程的详细日志记录器"""
     
-    def __init__(self, log_dir: str = "logs", debug_mode: bool = False):
+    def __init__(self, log_dir: str = "logs", debug_mode: bool = False, session_id: Optional[str] = None,
+                 pretty_json: bool = False, log_level: Optional[str] = None):
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
         self.debug_mode = debug_mode
-        self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 主日志级别；未指定时调试模式为DEBUG，否则为INFO
+        self.log_level = (log_level or ("DEBUG" if debug_mode else "INFO")).upper()
+        # 日志中的JSON是否缩进输出；与调试模式分开控制，默认紧凑输出
+        self.pretty_json = pretty_json
+        # 子进程沿用父进程的会话ID，日志写入同一组文件
+        self.session_id = session_id or datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # 创建不同级别的日志文件
         self.setup_loggers()
         
         # 进程跟踪
+        # list.append 在GIL下是原子操作；每个步骤字典只由创建它的线程修改，记录步骤时无需加锁
         self.process_steps = []
-        self._lock = threading.Lock() # 用于保护 process_steps
         
         # 使用线程本地存储来管理每个线程的步骤信息
         self.thread_local = threading.local()
@@ -31,7 +96,7 @@ class TranslationLogger:
         """设置不同级别的日志记录器"""
         # 主日志记录器
         self.main_logger = logging.getLogger('translation_main')
-        self.main_logger.setLevel(logging.DEBUG if self.debug_mode else logging.INFO)
+        self.main_logger.setLevel(self.log_level)
         
         # 处理过程日志记录器
         self.process_logger = logging.getLogger('translation_process')
@@ -55,61 +120,107 @@ class TranslationLogger:
         )
         
         # 文件处理器
-        main_handler = logging.FileHandler(
+        # 主日志和过程日志量大，使用带缓冲的处理器批量写盘；错误日志保持逐条写入，确保崩溃前的错误能落盘
+        # 三个文件处理器挂在同一个后台监听线程上，用名称过滤器保证每个文件只接收对应记录器的日志
+        main_handler = BufferedFileHandler(
             self.log_dir / f"translation_{self.session_id}.log",
             encoding='utf-8'
         )
         main_handler.setFormatter(detailed_formatter)
-        self.main_logger.addHandler(main_handler)
+        main_handler.addFilter(logging.Filter(self.main_logger.name))
         
-        process_handler = logging.FileHandler(
+        process_handler = BufferedFileHandler(
             self.log_dir / f"process_{self.session_id}.log",
             encoding='utf-8'
         )
         process_handler.setFormatter(detailed_formatter)
-        self.process_logger.addHandler(process_handler)
+        process_handler.addFilter(logging.Filter(self.process_logger.name))
         
         error_handler = logging.FileHandler(
             self.log_dir / f"error_{self.session_id}.log",
-            encoding='utf-8'
+            encoding='utf-8',
+            delay=True
         )
         error_handler.setFormatter(detailed_formatter)
-        self.error_logger.addHandler(error_handler)
+        error_handler.addFilter(logging.Filter(self.error_logger.name))
+        
+        self._main_handler = main_handler
+        handlers = [main_handler, process_handler, error_handler]
         
         # 控制台处理器（仅在调试模式下）
         if self.debug_mode:
             console_handler = logging.StreamHandler()
             console_handler.setFormatter(simple_formatter)
-            self.main_logger.addHandler(console_handler)
+            console_handler.addFilter(logging.Filter(self.main_logger.name))
+            handlers.append(console_handler)
+        
+        # 记录器只把日志放入队列，由后台线程写入文件，调用线程不会阻塞在磁盘I/O上
+        log_queue = queue.Queue(-1)
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        for logger in [self.main_logger, self.process_logger, self.error_logger]:
+            logger.addHandler(queue_handler)
+        
+        self._log_queue = log_queue
+        self._listener = _TimedFlushQueueListener(log_queue, *handlers, respect_handler_level=True)
+        self._listener.start()
+        # 进程退出时写完队列中剩余的日志并关闭文件
+        atexit.register(self._stop_listener, handlers)
+        
+    def _stop_listener(self, handlers: List[logging.Handler]):
+        """停止后台监听线程，并刷新、关闭所有文件处理器（重复调用无副作用）"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self._listener = None
+        for handler in handlers:
+            handler.close()
             
     def info(self, message: str, extra_data: Optional[Dict[str, Any]] = None):
         """记录信息级别日志"""
+        # 级别被过滤时直接返回，不构造日志条目也不序列化
+        if not self.main_logger.isEnabledFor(logging.INFO):
+            return
         log_entry = self._create_log_entry("INFO", message, extra_data)
-        self.main_logger.info(json.dumps(log_entry, ensure_ascii=False, indent=2))
+        self.main_logger.info(self._dumps(log_entry))
+        
+    def is_enabled_for(self, level: int) -> bool:
+        """判断主日志记录器是否会输出该级别的日志，用于在构造开销较大的日志数据前判断"""
+        return self.main_logger.isEnabledFor(level)
         
     def debug(self, message: str, extra_data: Optional[Dict[str, Any]] = None):
         """记录调试级别日志"""
+        if not self.main_logger.isEnabledFor(logging.DEBUG):
+            return
         log_entry = self._create_log_entry("DEBUG", message, extra_data)
-        self.main_logger.debug(json.dumps(log_entry, ensure_ascii=False, indent=2))
+        self.main_logger.debug(self._dumps(log_entry))
         
     def error(self, message: str, error: Optional[Exception] = None, extra_data: Optional[Dict[str, Any]] = None):
         """记录错误级别日志"""
+        if not self.error_logger.isEnabledFor(logging.ERROR):
+            return
         log_entry = self._create_log_entry("ERROR", message, extra_data)
         if error:
             log_entry["error_type"] = type(error).__name__
             log_entry["error_message"] = str(error)
             log_entry["error_traceback"] = str(error.__traceback__)
         
-        self.error_logger.error(json.dumps(log_entry, ensure_ascii=False, indent=2))
+        self.error_logger.error(self._dumps(log_entry))
+        
+    def _dumps(self, data: Dict[str, Any]) -> str:
+        """使用orjson序列化日志数据；仅在开启pretty_json时缩进，便于人工阅读"""
+        option = orjson.OPT_NON_STR_KEYS
+        if self.pretty_json:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option, default=str).decode()
         
     def _create_log_entry(self, level: str, message: str, extra_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """创建日志条目"""
         entry = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": self._timestamp(),
             "session_id": self.session_id,
             "level": level,
             "message": message,
-            "current_step": getattr(self.thread_local, 'current_step', None),
+            "current_step": self._current_step_name(),
             "thread_id": threading.get_ident()
         }
         
@@ -118,6 +229,27 @@ class TranslationLogger:
             
         return entry
         
+    def _timestamp(self) -> str:
+        """生成ISO格式时间戳，秒级前缀按线程缓存，同一秒内只需拼接微秒部分"""
+        now = time.time()
+        second = int(now)
+        cached = getattr(self.thread_local, 'timestamp_cache', None)
+        if cached is None or cached[0] != second:
+            cached = self.thread_local.timestamp_cache = (second, datetime.fromtimestamp(second).isoformat())
+        return f"{cached[1]}.{int((now - second) * 1_000_000):06d}"
+        
+    def _step_stack(self) -> List[tuple]:
+        """获取当前线程的步骤栈，栈中元素为 (步骤信息, 开始时间)，支持嵌套步骤"""
+        stack = getattr(self.thread_local, 'step_stack', None)
+        if stack is None:
+            stack = self.thread_local.step_stack = []
+        return stack
+        
+    def _current_step_name(self) -> Optional[str]:
+        """当前线程正在执行的（最内层）步骤名"""
+        stack = getattr(self.thread_local, 'step_stack', None)
+        return stack[-1][0]["step_name"] if stack else None
+        
     @contextmanager
     def step(self, step_name: str, description: str = ""):
         """上下文管理器，用于跟踪处理步骤"""
@@ -133,10 +265,6 @@ class TranslationLogger:
             
     def start_step(self, step_name: str, description: str = ""):
         """开始一个处理步骤"""
-        # 步骤信息存储在线程本地变量中
-        self.thread_local.current_step = step_name
-        self.thread_local.step_start_time = time.time()
-        
         step_info = {
             "step_name": step_name,
             "description": description,
@@ -145,8 +273,9 @@ class TranslationLogger:
             "thread_id": threading.get_ident()
         }
         
-        with self._lock:
-            self.process_steps.append(step_info)
+        self.process_steps.append(step_info)
+        # 步骤信息同时压入线程本地的步骤栈，结束时直接出栈，无需在全部步骤中查找
+        self._step_stack().append((step_info, time.time()))
         
         self.process_logger.info(f"开始步骤: {step_name} - {description} (线程: {threading.get_ident()})")
         
@@ -155,68 +284,59 @@ class TranslationLogger:
                 
     def end_step(self, result: Optional[Dict[str, Any]] = None):
         """结束当前处理步骤"""
-        # 从线程本地变量中获取步骤信息
-        current_step = getattr(self.thread_local, 'current_step', None)
-        step_start_time = getattr(self.thread_local, 'step_start_time', None)
-
-        if not current_step:
+        stack = self._step_stack()
+        if not stack:
             return
-            
-        duration = time.time() - step_start_time if step_start_time else 0
+        step_info, step_start_time = stack.pop()
+        current_step = step_info["step_name"]
+        duration = time.time() - step_start_time
         thread_id = threading.get_ident()
 
-        with self._lock:
-            # 更新对应的步骤信息
-            # 注意：这里需要一种更可靠的方式来找到并更新正确的步骤
-            # 简单起见，我们先按名称和线程ID查找
-            step_to_update = None
-            for step in reversed(self.process_steps):
-                if step.get("step_name") == current_step and step.get("thread_id") == thread_id and step.get("status") == "started":
-                    step_to_update = step
-                    break
-            
-            if step_to_update:
-                step_to_update.update({
-                    "end_time": datetime.now().isoformat(),
-                    "duration": duration,
-                    "status": "completed",
-                    "result": result
-                })
+        step_info.update({
+            "end_time": datetime.now().isoformat(),
+            "duration": duration,
+            "status": "completed",
+            "result": result
+        })
         
         self.process_logger.info(f"完成步骤: {current_step} (耗时: {duration:.2f}秒, 线程: {thread_id})")
         
         if self.debug_mode:
             print(f"✅ 完成步骤: {current_step} (耗时: {duration:.2f}秒, 线程: {thread_id})")
             
-        # 清理线程本地变量
-        self.thread_local.current_step = None
-        self.thread_local.step_start_time = None
-            
     def log_translation_chunk(self, chunk_info: Dict[str, Any]):
         """记录翻译块的详细信息"""
-        self.process_logger.info(f"翻译块信息: {json.dumps(chunk_info, ensure_ascii=False, indent=2)}")
+        if not self.process_logger.isEnabledFor(logging.INFO):
+            return
+        self.process_logger.info(f"翻译块信息: {self._dumps(chunk_info)}")
         
     def log_context_update(self, context_info: Dict[str, Any]):
         """记录上下文更新信息"""
-        self.process_logger.info(f"上下文更新: {json.dumps(context_info, ensure_ascii=False, indent=2)}")
+        if not self.process_logger.isEnabledFor(logging.INFO):
+            return
+        self.process_logger.info(f"上下文更新: {self._dumps(context_info)}")
         
     def log_token_usage(self, token_info: Dict[str, Any]):
         """记录Token使用情况"""
-        self.process_logger.info(f"Token使用: {json.dumps(token_info, ensure_ascii=False, indent=2)}")
+        if not self.process_logger.isEnabledFor(logging.INFO):
+            return
+        self.process_logger.info(f"Token使用: {self._dumps(token_info)}")
         
     def get_process_summary(self) -> Dict[str, Any]:
         """获取处理过程摘要"""
-        total_duration = sum(step.get("duration", 0) for step in self.process_steps)
+        # 复制一份快照（list和dict的复制在GIL下是原子的），避免其他线程同时追加或更新步骤
+        steps = [dict(step) for step in list(self.process_steps)]
+        total_duration = sum(step.get("duration", 0) for step in steps)
         
         return {
             "session_id": self.session_id,
-            "total_steps": len(self.process_steps),
+            "total_steps": len(steps),
             "total_duration": total_duration,
-            "steps": self.process_steps,
+            "steps": steps,
             "summary": {
-                "completed_steps": len([s for s in self.process_steps if s.get("status") == "completed"]),
-                "failed_steps": len([s for s in self.process_steps if s.get("status") == "failed"]),
-                "average_step_duration": total_duration / len(self.process_steps) if self.process_steps else 0
+                "completed_steps": len([s for s in steps if s.get("status") == "completed"]),
+                "failed_steps": len([s for s in steps if s.get("status") == "failed"]),
+                "average_step_duration": total_duration / len(steps) if steps else 0
             }
         }
         
@@ -225,21 +345,42 @@ class TranslationLogger:
         summary = self.get_process_summary()
         summary_file = self.log_dir / f"summary_{self.session_id}.json"
         
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, ensure_ascii=False, indent=2)
+        # orjson直接输出UTF-8字节，以二进制方式写入
+        with open(summary_file, 'wb') as f:
+            f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS, default=str))
             
         return summary_file
         
     def get_recent_logs(self, lines: int = 50) -> List[str]:
         """获取最近的日志条目"""
         main_log_file = self.log_dir / f"translation_{self.session_id}.log"
+        # 等待队列中已提交的日志处理完毕，再把缓冲区中的日志写入文件
+        if self._listener is not None:
+            self._log_queue.join()
+        self._main_handler.force_flush()
         
         if not main_log_file.exists():
             return []
             
-        with open(main_log_file, 'r', encoding='utf-8') as f:
-            all_lines = f.readlines()
-            return all_lines[-lines:] if len(all_lines) > lines else all_lines
+        if lines <= 0:
+            return []
+        
+        # 从文件末尾按8KB向前读取，直到凑够所需行数，读取量与日志文件大小无关
+        blocks = []
+        newline_count = 0
+        with open(main_log_file, 'rb') as f:
+            position = f.seek(0, os.SEEK_END)
+            # 需要多读到一个换行符，才能保证最前面的一行是完整的
+            while position > 0 and newline_count <= lines:
+                read_size = min(8192, position)
+                position -= read_size
+                f.seek(position)
+                block = f.read(read_size)
+                blocks.append(block)
+                newline_count += block.count(b"\n")
+        
+        tail_lines = b"".join(reversed(blocks)).splitlines(keepends=True)[-lines:]
+        return [line.decode('utf-8') for line in tail_lines]
 
 # 全局日志实例
 _logger_instance = None
@@ -251,8 +392,27 @@ def get_logger(debug_mode: bool = False) -> TranslationLogger:
         _logger_instance = TranslationLogger(debug_mode=debug_mode)
     return _logger_instance
 
-def init_logger(log_dir: str = "logs", debug_mode: bool = False) -> TranslationLogger:
+def init_logger(log_dir: str = "logs", debug_mode: bool = False, session_id: Optional[str] = None,
+                pretty_json: bool = False, log_level: Optional[str] = None) -> TranslationLogger:
     """初始化日志系统"""
     global _logger_instance
-    _logger_instance = TranslationLogger(log_dir=log_dir, debug_mode=debug_mode)
-    return _logger_instance 
\ No newline at end of file
+    _logger_instance = TranslationLogger(
+        log_dir=log_dir, debug_mode=debug_mode, session_id=session_id, pretty_json=pretty_json,
+        log_level=log_level
+    )
+    return _logger_instance
+
+def process_pool_options() -> Dict[str, Any]:
+    """
+    创建ProcessPoolExecutor所需的参数。
+    子进程以spawn方式启动，不继承父进程的日志队列（fork出的子进程中没有线程读取该队列，日志会丢失，
+    且fork时若监听线程正持有队列锁，子进程会卡死）；启动后以父进程的日志目录和会话ID重新初始化日志。
+    """
+    logger = get_logger()
+    return {
+        "mp_context": multiprocessing.get_context("spawn"),
+        "initializer": init_logger,
+        "initargs": (str(logger.log_dir.resolve()), logger.debug_mode, logger.session_id, logger.pretty_json,
+                     logger.log_level),
+    }
+ 
\ No newline at end of file
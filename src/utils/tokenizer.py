@@ -1,27 +1,80 @@
 """
 Token计算工具
 """
+import hashlib
+import os
+import threading
 import tiktoken
-from typing import List, Dict, Any
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Any, Tuple
 from config import config
 
+@lru_cache(maxsize=8)
+def _get_encoding(model_name: str) -> tiktoken.Encoding:
+    """按模型名获取编码器，BPE词表只加载一次，所有计算器实例共享"""
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # 如果模型不支持，使用默认编码
+        return tiktoken.get_encoding("cl100k_base")
+
 class TokenCalculator:
     """Token计算器"""
     
     def __init__(self, model_name: str = None):
         self.model_name = model_name or config.DEFAULT_MODEL
-        try:
-            self.encoding = tiktoken.encoding_for_model(self.model_name)
-        except KeyError:
-            # 如果模型不支持，使用默认编码
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = _get_encoding(self.model_name)
+        # 文本摘要 -> token数，只保存摘要，不持有原文
+        self._count_cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._count_cache_lock = threading.Lock()
     
     def count_tokens(self, text: str) -> int:
-        """计算文本的token数量"""
-        return len(self.encoding.encode(text))
+        """计算文本的token数量，相同文本（按blake2b摘要）直接返回缓存结果"""
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        with self._count_cache_lock:
+            count = self._count_cache.get(key)
+            if count is not None:
+                self._count_cache.move_to_end(key)
+                return count
+        
+        count = len(self.encoding.encode(text))
+        with self._count_cache_lock:
+            self._count_cache[key] = count
+            if len(self._count_cache) > config.TOKEN_COUNT_CACHE_SIZE:
+                self._count_cache.popitem(last=False)
+        return count
+    
+    def encode_and_count(self, text: str) -> Tuple[List[int], int]:
+        """编码文本，同时返回token列表和token数量"""
+        tokens = self.encoding.encode(text)
+        return tokens, len(tokens)
+    
+    def encode_batch(self, texts: List[str]) -> List[List[int]]:
+        """批量编码多段文本，tiktoken在多线程中并行编码（编码时释放GIL）"""
+        return self.encoding.encode_batch(texts, num_threads=os.cpu_count() or 1)
+    
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """批量计算多段文本的token数量"""
+        return [len(tokens) for tokens in self.encode_batch(texts)]
+    
+    def estimate_tokens(self, text: str) -> int:
+        """
+        快速估算文本的token数量，不调用BPE编码
+        英文等ASCII字符约4个字符1个token，中文等多字节字符约1个字符1个token。
+        只用到C实现的len和encode，适合只需要粗略判断大小的场景。
+        """
+        char_count = len(text)
+        byte_count = len(text.encode('utf-8'))
+        # 多字节字符以3字节（CJK）计，反推其数量
+        non_ascii_count = (byte_count - char_count) // 2
+        ascii_count = char_count - non_ascii_count
+        return ascii_count // 4 + non_ascii_count
     
     def count_tokens_for_messages(self, messages: List[Any]) -> int:
         """计算消息列表的token数量"""
+        # 先收集所有需要编码的文本，再一次批量编码，固定开销单独累加
+        texts = []
         total_tokens = 0
         for message in messages:
             # 每个消息有固定的开销
@@ -30,20 +83,22 @@ class TokenCalculator:
             # 处理LangChain消息对象
             if hasattr(message, 'content'):
                 # LangChain消息对象
-                total_tokens += self.count_tokens(message.content)
+                texts.append(message.content)
                 if hasattr(message, 'name') and message.name:
                     total_tokens += 1
             elif isinstance(message, dict):
                 # 字典格式的消息
                 for key, value in message.items():
                     if isinstance(value, str):
-                        total_tokens += self.count_tokens(value)
+                        texts.append(value)
                         if key == "name":  # 如果有name字段，额外增加token
                             total_tokens += 1
             else:
                 # 其他格式，尝试转换为字符串
-                total_tokens += self.count_tokens(str(message))
-                
+                texts.append(str(message))
+        
+        if texts:
+            total_tokens += sum(self.count_tokens_batch(texts))
         total_tokens += 2  # 对话的固定开销
         return total_tokens
     
@@ -51,6 +106,8 @@ class TokenCalculator:
         """检查文本是否在token限制内"""
         ratio = ratio or config.SAFE_TOKEN_RATIO
         max_tokens = int(config.MAX_TOKENS * ratio)
+        if self._fits_without_encoding(text, max_tokens):
+            return True
         return self.count_tokens(text) <= max_tokens
     
     def get_max_tokens(self, ratio: float = None) -> int:
@@ -60,12 +117,24 @@ class TokenCalculator:
     
     def truncate_text(self, text: str, max_tokens: int) -> str:
         """截断文本到指定的token数量"""
-        tokens = self.encoding.encode(text)
+        if self._fits_without_encoding(text, max_tokens):
+            return text
+        # encode_ordinary 不扫描特殊token，比 encode 少一遍正则匹配
+        tokens = self.encoding.encode_ordinary(text)
         if len(tokens) <= max_tokens:
             return text
         
-        truncated_tokens = tokens[:max_tokens]
-        return self.encoding.decode(truncated_tokens)
+        return self.encoding.decode(tokens[:max_tokens])
+    
+    @staticmethod
+    def _fits_without_encoding(text: str, max_tokens: int) -> bool:
+        """
+        BPE的每个token至少对应1个字节，UTF-8字节数不超过上限时token数必然也不超过，无需编码。
+        字符数乘4（UTF-8单字符最多4字节）不超过上限时连字节数都不用计算。
+        """
+        if len(text) * 4 <= max_tokens:
+            return True
+        return len(text.encode('utf-8')) <= max_tokens
 
 # 全局token计算器实例
 token_calculator = TokenCalculator() 
\ No newline at end of file